@@ -0,0 +1,275 @@
+"""Hermetic benchmarks of ingestion and search, using the stand-ins in fakes.py.
+
+No API keys or network are needed, so runs are repeatable on a laptop. For each corpus size a
+synthetic set of papers is ingested through connections.process_questions, then a mix of topic,
+filtered, exact-reference and free-form queries is run through QueryProcessor.search_questions,
+sequentially and from a thread pool.
+
+Usage:
+    python benchmark.py --sizes 500,5000,50000 --queries 200 --workers 8 --latency-ms 0 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+QUESTIONS_PER_PAPER = 40
+SUBJECTS = [("5054", "Physics"), ("5070", "Chemistry")]
+SESSIONS = ["February/March", "May/June", "October/November"]
+VARIANTS = ["11", "12", "13"]
+TOPICS = {
+    "Physics": ["magnetism", "electricity", "forces", "pressure", "waves", "optics", "radioactivity",
+                "thermal physics", "kinematics", "density"],
+    "Chemistry": ["acids and bases", "bonding", "electrolysis", "organic chemistry", "the mole",
+                  "periodic table", "redox", "metals", "rates of reaction", "ammonia"],
+}
+WORDS = ["diagram", "shows", "value", "calculate", "which", "statement", "correct", "measured",
+         "experiment", "student", "sample", "increase", "decrease", "energy", "particles", "graph"]
+
+
+def synthetic_papers(n_questions, seed=0):
+    """Yield paper dicts (connections.py JSON format) with n_questions questions in total"""
+    rng = random.Random(seed)
+    paper_number = 0
+    remaining = n_questions
+    while remaining > 0:
+        code, subject = SUBJECTS[paper_number % len(SUBJECTS)]
+        slot = paper_number // len(SUBJECTS)
+        variant = VARIANTS[slot % len(VARIANTS)]
+        session = SESSIONS[(slot // len(VARIANTS)) % len(SESSIONS)]
+        year = 2000 + slot // (len(VARIANTS) * len(SESSIONS))
+        count = min(QUESTIONS_PER_PAPER, remaining)
+        questions = []
+        for number in range(1, count + 1):
+            topic = rng.choice(TOPICS[subject])
+            statement = f"{topic.capitalize()}: " + " ".join(rng.choice(WORDS) for _ in range(12))
+            questions.append({
+                "questionNumber": number,
+                "statement": statement,
+                "options": {letter: " ".join(rng.choice(WORDS) for _ in range(3)) for letter in "ABCD"},
+                "topics": [topic],
+                "image": "",
+            })
+        yield {
+            "exam": "O Level",
+            "subjectCode": code,
+            "subject": subject,
+            "paper": "Paper 1",
+            "variant": variant,
+            "year": f"{session} {year}",
+            "questions": questions,
+        }
+        paper_number += 1
+        remaining -= count
+
+
+def query_mix(papers, n_queries, seed=0):
+    """Topic, filtered, exact-reference and LLM-parsed queries over the given papers"""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n_queries):
+        paper = rng.choice(papers)
+        topic = rng.choice(TOPICS[paper["subject"]])
+        session, year = paper["year"].split()
+        kind = i % 4
+        if kind == 0:
+            queries.append(f"{topic} questions")
+        elif kind == 1:
+            queries.append(f"{paper['subject'].lower()} {topic} questions from {year}")
+        elif kind == 2:
+            number = rng.randint(1, len(paper["questions"]))
+            queries.append(f"{paper['subjectCode']} variant {paper['variant']} "
+                           f"{session.split('/')[0]} {year} question {number}")
+        else:
+            # Relative dates are left to the model
+            queries.append(f"recent {topic} problems about a {rng.choice(WORDS)}")
+    return queries
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[position]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def metadata_bytes(index, papers, sample=200):
+    """Mean JSON size of the metadata stored with a vector, over the first `sample` questions"""
+    from paper_loader import build_question_record
+    ids = [build_question_record(paper, q)[0] for paper in papers for q in paper["questions"]][:sample]
+    vectors = index.fetch(ids=ids).vectors
+    sizes = [len(json.dumps(vector.metadata, default=str)) for vector in vectors.values()]
+    return sum(sizes) / len(sizes) if sizes else 0.0
+
+
+def bench_ingestion(connections, papers, index, manifest, cache, keyword_index, batch_size, workers, slim=False,
+                    document_store=None):
+    tracemalloc.start()
+    start = time.perf_counter()
+    embedded = 0
+    for paper in papers:
+        stats = connections.process_questions(
+            paper, batch_size=batch_size, max_workers=workers, index=index, manifest=manifest, cache=cache,
+            keyword_index=keyword_index, slim=slim, document_store=document_store
+        )
+        embedded += stats["questions"]
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "questions": embedded,
+        "seconds": elapsed,
+        "questions_per_second": embedded / elapsed if elapsed > 0 else 0.0,
+        "peak_traced_mb": peak / (1024 * 1024),
+        "index_vectors": index.describe_index_stats()["total_vector_count"],
+        "metadata_bytes_per_vector": metadata_bytes(index, papers),
+    }
+
+
+def bench_search(processor, queries, workers, index=None):
+    def timed(query):
+        start = time.perf_counter()
+        results = processor.search_questions(query)
+        return time.perf_counter() - start, len(results)
+
+    calls_before, bytes_before = (index.query_calls, index.payload_bytes) if index is not None else (0, 0)
+    start = time.perf_counter()
+    if workers <= 1:
+        outcomes = [timed(query) for query in queries]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    latencies = [seconds * 1000 for seconds, _ in outcomes]
+    index_calls = index.query_calls - calls_before if index is not None else 0
+    payload = index.payload_bytes - bytes_before if index is not None else 0
+    return {
+        "queries": len(queries),
+        "workers": workers,
+        "seconds": elapsed,
+        "queries_per_second": len(queries) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_results": sum(n for _, n in outcomes) / len(outcomes) if outcomes else 0.0,
+        "query_payload_bytes": payload / index_calls if index_calls else 0.0,
+    }
+
+
+def run_size(size, args, workdir):
+    # Imported here, after main() pointed the backends at workdir, so nothing touches the network
+    import connections
+    from embedding_cache import EmbeddingCache
+    from fakes import FakeIndex, HashEmbedder, ScriptedModel
+    from gemini_client import GeminiScheduler
+    from document_store import DocumentStore
+    from ingest_manifest import IngestManifest
+    from keyword_index import KeywordIndex
+    from query_processor import QueryProcessor
+
+    papers = list(synthetic_papers(size, seed=args.seed))
+    # Stand-in calls share one scheduler, limited to --rpm like the real API (0 = unlimited)
+    scheduler = GeminiScheduler(rpm=args.rpm, embed_rpm=args.rpm, max_concurrency=max(8, args.workers))
+    embedder = HashEmbedder(latency_ms=args.latency_ms)
+    index = FakeIndex(latency_ms=args.latency_ms)
+    manifest = IngestManifest(namespace=f"bench:{size}",
+                              path=os.path.join(workdir, f"manifest_{size}.sqlite3"))
+    ingest_cache = EmbeddingCache(path=None, embed_fn=embedder, scheduler=scheduler)
+    keyword_index = KeywordIndex()
+    document_store = DocumentStore(os.path.join(workdir, f"documents_{size}.sqlite3")) if args.slim else None
+    ingestion = bench_ingestion(connections, papers, index, manifest, ingest_cache, keyword_index,
+                                args.batch_size, args.workers, slim=args.slim, document_store=document_store)
+
+    # Physics and chemistry share one index here; subjects are separated by subjectCode
+    model = ScriptedModel(latency_ms=args.latency_ms)
+    query_cache = EmbeddingCache(path=None, embed_fn=embedder, scheduler=scheduler)
+    keyword_indexes = {"physics": keyword_index, "chemistry": keyword_index} if args.keyword else None
+    processor = QueryProcessor(index, index, embedding_cache=query_cache, model=model,
+                               keyword_indexes=keyword_indexes, scheduler=scheduler, document_store=document_store)
+    queries = query_mix(papers, args.queries, seed=args.seed)
+    sequential = bench_search(processor, queries, workers=1, index=index)
+    # Cold query-embedding and semantic caches again, so both runs do the same work
+    processor.embedding_cache = EmbeddingCache(path=None, embed_fn=embedder, scheduler=scheduler)
+    if processor.semantic_cache is not None:
+        processor.semantic_cache.clear()
+    concurrent = bench_search(processor, queries, workers=args.workers, index=index)
+
+    return {
+        "size": size,
+        "papers": len(papers),
+        "ingestion": ingestion,
+        "search_sequential": sequential,
+        "search_concurrent": concurrent,
+        "llm_bypass_rate": processor.llm_bypass_rate(),
+        "query_embedding_batches": processor.embedding_batcher.stats(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of ingestion and search")
+    parser.add_argument("--sizes", default="500,5000,50000", help="comma-separated corpus sizes (questions)")
+    parser.add_argument("--queries", type=int, default=200, help="queries per search run")
+    parser.add_argument("--workers", type=int, default=8, help="threads for concurrent search and embedding")
+    parser.add_argument("--batch-size", type=int, default=50, help="texts per embedding call during ingestion")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per backend call")
+    parser.add_argument("--rpm", type=float, default=0,
+                        help="requests per minute allowed per stand-in model (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-keyword", dest="keyword", action="store_false",
+                        help="search without the BM25 keyword index (dense only)")
+    parser.add_argument("--slim", action="store_true",
+                        help="ingest slim vector metadata with full questions in a document store")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix="caie-bench-") as workdir:
+        # Keep module-level state of connections.py (local index, manifest, caches) in workdir
+        os.environ["INDEX_BACKEND"] = "local"
+        os.environ["LOCAL_INDEX_DIR"] = os.path.join(workdir, "indexes")
+        os.environ["EMBEDDING_CACHE_PATH"] = ""
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        os.chdir(workdir)
+
+        results = []
+        for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+            result = run_size(size, args, workdir)
+            results.append(result)
+            ingestion = result["ingestion"]
+            search = result["search_concurrent"]
+            print(f"{size} questions: ingest {ingestion['questions_per_second']:.0f} q/s "
+                  f"(peak {ingestion['peak_traced_mb']:.1f} MB traced), "
+                  f"search {result['search_sequential']['queries_per_second']:.0f} q/s sequential / "
+                  f"{search['queries_per_second']:.0f} q/s with {search['workers']} workers, "
+                  f"p50 {search['p50_ms']:.1f} ms, p95 {search['p95_ms']:.1f} ms, "
+                  f"{ingestion['metadata_bytes_per_vector']:.0f} B metadata/vector, "
+                  f"{search['query_payload_bytes']:.0f} B per index query")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"latency_ms": args.latency_ms, "results": results}, f, indent=2)
+        print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
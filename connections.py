@@ -1,9 +1,16 @@
 import os
-import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import google.generativeai as genai
 from dotenv import load_dotenv
-import json
-from pinecone import Pinecone, ServerlessSpec
+from embedding_cache import get_default_cache
+from document_store import get_document_store, slim_ingestion_enabled, slim_metadata
+from index_registry import get_registry
+from local_index import LocalIndex
+from metrics import configure_logging, log_event
+from ingest_manifest import IngestManifest, paper_key
+from paper_loader import build_question_record, discover_paper_files, load_json_with_encoding
 
 # Load environment variables
 load_dotenv()
@@ -11,87 +18,159 @@ load_dotenv()
 # Configure Gemini
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index_name = "o-level-chemistry-paper-1"
-
-# Create Pinecone index (updated for v6+)
-if index_name not in pc.list_indexes().names():
-    pc.create_index(
-        name=index_name,
-        dimension=768,  # Match your embedding model
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"
-        )
-        # metadata_config removed in v6+
-    )
-
-index = pc.Index(index_name)
-
-def process_questions(data):
-    vectors = []
-    for q in data["questions"]:
-        # Generate embedding
-        unique_id = f"{data['subjectCode']}_{data['variant']}_{data['year']}_q{q['questionNumber']}"
-        embedding = genai.embed_content(
-            model="models/text-embedding-004",
-            # content=q['statement'],
-            content = f"""
-            Exam: {data['exam']}
-            Paper: {data['paper']}
-            Year: {data['year']}
-            Question: {q['statement']}
-            Topics: {', '.join(q['topics'])}
-            """,
+# Each paper goes to the index configured for its subject code and paper in indexes.json
+# (local NumPy index saved under LOCAL_INDEX_DIR once per paper, or Pinecone created
+# on first use). Manifests track what is already in each index, so re-runs only touch new,
+# changed or deleted questions.
+_manifests = {}
+
+
+def paper_target(data):
+    """Return the (index, manifest, keyword index) a paper is ingested into, connecting on first use"""
+    registry = get_registry()
+    spec = registry.spec_for_paper(data["subjectCode"], data.get("paper"))
+    if spec.name not in _manifests:
+        _manifests[spec.name] = IngestManifest(namespace=f"{spec.resolved_backend}:{spec.name}")
+    # The local BM25 index next to it is used for keyword matching, fused with dense results
+    return registry.vector_index(spec.name, create=True), _manifests[spec.name], registry.keyword_index(spec.name)
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "50"))  # API allows up to 100 texts per call
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))  # embedding batches in flight at once
+
+def process_questions(data, batch_size=EMBED_BATCH_SIZE, max_workers=EMBED_WORKERS, force=False,
+                      index=None, manifest=None, cache=None, keyword_index=None, slim=None, document_store=None):
+    """Embed and upsert the new or changed questions of a paper.
+
+    The manifest skips questions whose embedded text and metadata are unchanged, and deletes
+    questions that are no longer in the paper; force=True re-ingests everything.
+    Questions are embedded in multi-text batches with up to max_workers batches in flight;
+    each batch is upserted, then recorded in the manifest, as soon as its embeddings arrive
+    (a local index is saved once for the whole paper, and the manifest written after that).
+    Questions missing from the keyword index are added to it without re-embedding them.
+    slim=True (default SLIM_METADATA) keeps only the filterable fields in the vector index and
+    the full question in the document store, which search reads for the results it returns.
+    index, manifest and keyword_index default to the paper's registry index (benchmarks pass stand-ins).
+    """
+    if index is None or manifest is None or keyword_index is None:
+        target = paper_target(data)
+        index = target[0] if index is None else index
+        manifest = target[1] if manifest is None else manifest
+        keyword_index = target[2] if keyword_index is None else keyword_index
+    slim = slim_ingestion_enabled() if slim is None else slim
+    if slim and document_store is None:
+        document_store = get_document_store()
+    paper = paper_key(data)
+    records = [build_question_record(data, q) for q in data["questions"]]
+    hashes = {
+        unique_id: IngestManifest.record_hash(content, metadata, slim)
+        for unique_id, content, metadata in records
+    }
+    known = manifest.hashes(paper)
+    pending = [record for record in records if force or known.get(record[0]) != hashes[record[0]]]
+    removed = [unique_id for unique_id in known if unique_id not in hashes]
+
+    # Local indexes rewrite their whole file on every save, so they are saved once per paper
+    # and only then recorded in the manifest (an interrupted paper is re-ingested next run)
+    local = isinstance(index, LocalIndex)
+    if removed:
+        index.delete(ids=removed)
+        keyword_index.delete(removed)
+        if document_store is not None:
+            document_store.delete(removed)
+        if not local:
+            manifest.remove(removed)
+
+    # Unchanged questions only need indexing by keyword (e.g. the first run after an upgrade)
+    pending_ids = {record[0] for record in pending}
+    keyword_index.upsert([
+        (unique_id, metadata) for unique_id, _, metadata in records
+        if unique_id not in pending_ids and unique_id not in keyword_index
+    ])
+
+    batches = [pending[i:i+batch_size] for i in range(0, len(pending), batch_size)]
+    cache = cache or get_default_cache()
+
+    def embed(batch):
+        # Cached, so re-ingesting unchanged questions does not call the API again
+        embeddings = cache.embed_many(
+            [content for _, content, _ in batch],
+            model=EMBEDDING_MODEL,
             task_type="retrieval_document"
-        )['embedding']
-        months_part, year = data['year'].split()
-        months = months_part.split('/')
-        metadata = {
-            "exam": data["exam"],
-            "subjectCode": data["subjectCode"],
-            "variant": data["variant"],
-            "year": year,
-            "months":months,
-            "subject": data["subject"],
-            "paper": data["paper"],
-            "questionNumber": q["questionNumber"],
-            "questionStatement": q["statement"],
-            "options": q["options"],
-            "topics": q["topics"],
-            "image": q["image"]
-        }
-        
-        vectors.append((unique_id, embedding, metadata))
-    
-    # Batch upsert
-    for batch in [vectors[i:i+100] for i in range(0, len(vectors), 100)]:
-        index.upsert(batch)
-
-# Load data
-
-def load_json_with_encoding(filepath):
-    encodings = ["utf-8", "utf-8-sig", "latin1", "iso-8859-1"]
-    for encoding in encodings:
-        try:
-            with open(filepath, "r", encoding=encoding) as f:
-                return json.load(f)
-        except UnicodeDecodeError:
-            continue
-    raise ValueError(f"Could not decode {filepath} with any supported encoding")
-
-
-# directory = r"F:/FYP/Current/o-level-physics-5054-20241117T145438Z-001/jsonFormat/chem_json_format"
-# # Get all files in the directory and filter JSON files
-# file_paths = [
-#     os.path.join(directory, file)
-#     for file in os.listdir(directory)
-#     if file.endswith(".json")
-# ]
-# for file_path in file_paths:
-#     exam_data = load_json_with_encoding(file_path)
-#     print("inserting data into pinecone")
-#     process_questions(exam_data)
-# print("Done")
\ No newline at end of file
+        )
+        return [(unique_id, embedding, metadata) for (unique_id, _, metadata), embedding in zip(batch, embeddings)]
+
+    start = time.perf_counter()
+    unsaved = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(embed, batch) for batch in batches]
+        # Upsert in this thread while the remaining batches are still embedding
+        for future in as_completed(futures):
+            vectors = future.result()
+            if slim:
+                document_store.put_many([(unique_id, metadata) for unique_id, _, metadata in vectors])
+                index.upsert([
+                    (unique_id, embedding, slim_metadata(metadata)) for unique_id, embedding, metadata in vectors
+                ])
+            else:
+                index.upsert(vectors)
+            keyword_index.upsert([(unique_id, metadata) for unique_id, _, metadata in vectors])
+            entries = [(unique_id, hashes[unique_id]) for unique_id, _, _ in vectors]
+            if local:
+                unsaved.extend(entries)
+            else:
+                manifest.mark(paper, entries)
+    if local and (removed or unsaved):
+        index.flush()
+        if removed:
+            manifest.remove(removed)
+        manifest.mark(paper, unsaved)
+    keyword_index.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = len(pending) / elapsed if elapsed > 0 and pending else 0.0
+    log_event("paper_ingested", paper=paper, embedded=len(pending), unchanged=len(records) - len(pending),
+              removed=len(removed), seconds=round(elapsed, 1), questions_per_second=round(rate, 1))
+    return {
+        "questions": len(pending),
+        "unchanged": len(records) - len(pending),
+        "removed": len(removed),
+        "seconds": elapsed,
+        "questions_per_second": rate
+    }
+
+def ingest_directory(directory, force=False, slim=None):
+    """Ingest every JSON paper under directory and drop papers whose files are gone from the
+    indexes that received papers"""
+    registry = get_registry()
+    slim = slim_ingestion_enabled() if slim is None else slim
+    seen_papers = {}  # index name -> paper keys
+    for file_path in discover_paper_files([directory]):
+        exam_data = load_json_with_encoding(file_path)
+        index, manifest, keyword_index = paper_target(exam_data)
+        name = registry.spec_for_paper(exam_data["subjectCode"], exam_data.get("paper")).name
+        seen_papers.setdefault(name, set()).add(paper_key(exam_data))
+        log_event("paper_inserting", path=file_path, index=name)
+        process_questions(exam_data, force=force, index=index, manifest=manifest, keyword_index=keyword_index,
+                          slim=slim)
+
+    for name, papers in seen_papers.items():
+        index, manifest, keyword_index = registry.vector_index(name), _manifests[name], registry.keyword_index(name)
+        for paper in manifest.papers() - papers:
+            removed = list(manifest.hashes(paper))
+            index.delete(ids=removed)
+            keyword_index.delete(removed)
+            if slim:
+                get_document_store().delete(removed)
+            manifest.remove(removed)
+            log_event("paper_removed", paper=paper, questions=len(removed), reason="file no longer present")
+        if isinstance(index, LocalIndex):
+            index.flush()
+        keyword_index.flush()
+    log_event("ingest_done", indexes=len(seen_papers))
+
+if __name__ == "__main__":
+    # e.g. python connections.py F:/FYP/Current/o-level-physics-5054-20241117T145438Z-001/jsonFormat/chem_json_format
+    # --slim keeps only filterable fields in the index and full questions in the document store
+    configure_logging()
+    ingest_directory(sys.argv[1], force="--force" in sys.argv[2:], slim=True if "--slim" in sys.argv[2:] else None)
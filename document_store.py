@@ -0,0 +1,77 @@
+import os
+import json
+import sqlite3
+import threading
+
+DEFAULT_DOCUMENT_STORE_PATH = os.path.join(".cache", "documents.sqlite3")
+
+# Metadata kept in the vector index with slim ingestion: just what search filters on
+SLIM_FIELDS = ["subjectCode", "variant", "year", "months", "questionNumber"]
+
+
+def slim_metadata(metadata: dict) -> dict:
+    return {field: metadata[field] for field in SLIM_FIELDS if field in metadata}
+
+
+class DocumentStore:
+    """Full question metadata (statement, options, topics, image, ...) keyed by question ID.
+
+    With slim ingestion the vector index only holds SLIM_FIELDS; the rest lives here and is
+    read in one query per result page.
+    """
+
+    def __init__(self, path=DEFAULT_DOCUMENT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, body TEXT)")
+        self._db.commit()
+
+    def put_many(self, items):
+        """Store (id, metadata) pairs with a single commit"""
+        rows = [(doc_id, json.dumps(metadata, default=str)) for doc_id, metadata in items]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO documents (id, body) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def get_many(self, ids) -> dict:
+        """Return {id: metadata} for the stored IDs among ids"""
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        with self._lock:
+            # Stay under SQLite's default limit of 999 bound parameters
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT id, body FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((doc_id, json.loads(body)) for doc_id, body in rows)
+        return found
+
+    def delete(self, ids):
+        with self._lock:
+            self._db.executemany("DELETE FROM documents WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_document_store() -> DocumentStore:
+    """Process-wide store shared by ingestion and search (DOCUMENT_STORE_PATH)"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = DocumentStore(os.getenv("DOCUMENT_STORE_PATH", DEFAULT_DOCUMENT_STORE_PATH))
+        return _default_store
+
+
+def slim_ingestion_enabled() -> bool:
+    return os.getenv("SLIM_METADATA", "false").lower() in ["1", "true", "yes"]
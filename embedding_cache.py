@@ -0,0 +1,278 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import google.generativeai as genai
+from gemini_client import get_scheduler
+from metrics import registry
+from tracing import count, current_trace
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite3")
+
+# The embedding API accepts at most this many texts per call
+MAX_TEXTS_PER_CALL = 100
+
+
+def embed_batch(texts, model: str, task_type: str, embed_fn=None, scheduler=None) -> list:
+    """Embed several texts in as few API calls as allowed (MAX_TEXTS_PER_CALL each) through the
+    Gemini scheduler (rate limits, retries, and one request for identical batches in flight)"""
+    embed_fn = embed_fn or genai.embed_content
+    scheduler = scheduler or get_scheduler()
+    texts = list(texts)
+    vectors = []
+    for start in range(0, len(texts), MAX_TEXTS_PER_CALL):
+        chunk = texts[start:start + MAX_TEXTS_PER_CALL]
+        response = scheduler.call(
+            model, embed_fn, model=model, content=chunk, task_type=task_type, key=(task_type, tuple(chunk))
+        )
+        vectors.extend(response["embedding"])
+    return vectors
+
+
+def normalize_text(text: str, task_type: str) -> str:
+    """Collapse whitespace; queries are also lowercased since their case carries no meaning"""
+    normalized = " ".join(text.split())
+    return normalized.lower() if task_type == "retrieval_query" else normalized
+
+
+class EmbeddingCache:
+    """Embedding cache with an in-memory LRU layer backed by SQLite.
+
+    Entries are keyed by (normalized text, model, task_type) and stored as float32 blobs.
+    Pass path=None to keep the cache in memory only. embed_fn replaces genai.embed_content
+    for misses (e.g. fakes.HashEmbedder); misses go through scheduler (default get_scheduler()).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_memory_items=2048, embed_fn=None, scheduler=None):
+        self.path = path
+        self.embed_fn = embed_fn
+        self.scheduler = scheduler
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, task_type TEXT, vector BLOB)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(text: str, model: str, task_type: str) -> str:
+        raw = f"{model}\x00{task_type}\x00{normalize_text(text, task_type)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str, model: str, task_type: str):
+        """Return the cached embedding or None"""
+        key = self.make_key(text, model, task_type)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                count("cache_hits", cache="embedding_memory")
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    count("cache_hits", cache="embedding_disk")
+                    return vector
+
+            self.misses += 1
+            count("cache_misses", cache="embedding")
+            return None
+
+    def put(self, text: str, model: str, task_type: str, vector):
+        self.put_many([text], model, task_type, [vector])
+
+    def put_many(self, texts, model: str, task_type: str, vectors):
+        """Store several embeddings with a single disk commit"""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(text, model, task_type)
+                vector = list(vector)
+                self._remember(key, vector)
+                rows.append((key, model, task_type, array("f", vector).tobytes()))
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, task_type, vector) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._db.commit()
+
+    def embed(self, text: str, model: str, task_type: str, embed_fn=None, batcher=None):
+        """Return the embedding for text, calling embed_fn (genai.embed_content) only on a miss.
+
+        With a batcher (EmbeddingBatcher) misses are sent together with other callers' texts.
+        """
+        vector = self.get(text, model, task_type)
+        if vector is None and batcher is not None:
+            vector = batcher.embed(text)
+            self.put(text, model, task_type, vector)
+        elif vector is None:
+            count("embedding_api_calls")
+            embed_fn = embed_fn or self.embed_fn or genai.embed_content
+            vector = (self.scheduler or get_scheduler()).call(
+                model, embed_fn, model=model, content=text, task_type=task_type, key=(task_type, text)
+            )["embedding"]
+            self.put(text, model, task_type, vector)
+        return vector
+
+    def embed_many(self, texts, model: str, task_type: str, embed_fn=None) -> list:
+        """Return embeddings for texts, sending the cache misses in batched calls"""
+        vectors = [self.get(text, model, task_type) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = embed_batch([texts[i] for i in missing], model, task_type, embed_fn=embed_fn or self.embed_fn,
+                                scheduler=self.scheduler)
+            self.put_many([texts[i] for i in missing], model, task_type, fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = list(vector)
+        return vectors
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+            }
+
+
+class EmbeddingBatcher:
+    """Collects single-text embedding requests from every thread into batched API calls.
+
+    The first text of a batch waits up to window_ms for others, or until max_batch texts are
+    queued; then one embed_many(texts) call serves them all and each caller gets its vector
+    through a Future. Up to `workers` batches are embedded at once. window_ms=0 embeds each
+    text on its own, in the caller's thread. Each caller's QueryTrace counts the API call its
+    text went out in.
+    """
+
+    def __init__(self, embed_many, window_ms=2.0, max_batch=32, workers=4):
+        self.embed_many = embed_many
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = []  # (text, future, enqueued at, caller's trace)
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding-batcher")
+        self._thread = None
+        self.batches = 0
+        self.texts = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        registry.set_gauge("embed_batch_window_seconds", self.window)
+        registry.set_gauge("embed_batch_max_size", max_batch)
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        item = (text, future, time.monotonic(), current_trace.get())
+        if self.window <= 0:
+            self._flush([item])
+            return future
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name="embedding-batcher", daemon=True)
+                self._thread.start()
+            self._queue.append(item)
+            self._condition.notify()
+        return future
+
+    def embed(self, text: str):
+        return self.submit(text).result()
+
+    def _collect(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                deadline = self._queue[0][2] + self.window
+                while len(self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        texts = list(dict.fromkeys(text for text, _, _, _ in batch))
+        delays = [started - enqueued for _, _, enqueued, _ in batch]
+        with self._condition:
+            self.batches += 1
+            self.texts += len(batch)
+            self.queue_seconds += sum(delays)
+            self.max_queue_seconds = max([self.max_queue_seconds] + delays)
+        registry.observe_size("embed_batch_size", len(texts))
+        for delay in delays:
+            registry.observe("embed_queue", delay)
+        # This runs outside the callers' contexts, so count the call into each of their traces
+        registry.inc("embedding_api_calls")
+        for trace in {id(trace): trace for _, _, _, trace in batch if trace is not None}.values():
+            trace.counters["embedding_api_calls"] += 1
+        try:
+            vectors = dict(zip(texts, self.embed_many(texts)))
+        except Exception as e:
+            for _, future, _, _ in batch:
+                future.set_exception(e)
+            return
+        for text, future, _, _ in batch:
+            future.set_result(list(vectors[text]))
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "mean_queue_ms": self.queue_seconds / self.texts * 1000 if self.texts else 0.0,
+                "max_queue_ms": self.max_queue_seconds * 1000,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> EmbeddingCache:
+    """Process-wide cache shared by search and ingestion (EMBEDDING_CACHE_PATH, empty = memory only)"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH) or None)
+        return _default_cache
+
+
+def embed_content(model: str, content: str, task_type: str) -> dict:
+    """Cached drop-in for genai.embed_content with a single text"""
+    return {"embedding": get_default_cache().embed(content, model, task_type)}
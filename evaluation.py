@@ -1,7 +1,12 @@
 import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from pinecone import Pinecone
 from query_processor import QueryProcessor
+from tracing import QueryTrace
+from metrics import start_exporter
 import google.generativeai as genai
 from typing import List, Dict, Set
 import numpy as np
@@ -16,17 +21,23 @@ def configure_gemini():
     genai.configure(api_key=google_api_key)
     return genai.GenerativeModel('gemini-1.5-flash')
 
-def initialize_pinecone():
-    """Initialize and return Pinecone index connection"""
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    return pc.Index("o-level-physics-paper-1")
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of a list of durations, in milliseconds"""
+    values_ms = np.array(values) * 1000
+    return {
+        "count": int(len(values_ms)),
+        "mean_ms": float(np.mean(values_ms)),
+        "p50_ms": float(np.percentile(values_ms, 50)),
+        "p95_ms": float(np.percentile(values_ms, 95)),
+        "p99_ms": float(np.percentile(values_ms, 99))
+    }
 
 # Evaluation class
 class RagEvaluator:
-    def __init__(self, test_data):
+    def __init__(self, test_data, max_workers=4, query_processor=None):
         self.test_data = test_data
-        self.index = initialize_pinecone()
-        self.query_processor = QueryProcessor(self.index)
+        self.max_workers = max_workers
+        self.query_processor = query_processor or QueryProcessor()
         self.gemini_model = configure_gemini()
         
     def _doc_id_from_meta(self, meta):
@@ -95,8 +106,15 @@ class RagEvaluator:
         
         return metrics
 
+    def _run_query(self, query: str):
+        """Search one query, returning its results, stage trace and total wall time"""
+        trace = QueryTrace()
+        start = time.perf_counter()
+        results = self.query_processor.search_questions(query, trace=trace)
+        return results, trace, time.perf_counter() - start
+
     def evaluate(self):
-        """Evaluate the RAG system on all test cases"""
+        """Evaluate the RAG system on all test cases, running up to max_workers queries at once"""
         all_metrics = {
             'precision@10': [],
             'recall@10': [],
@@ -111,18 +129,25 @@ class RagEvaluator:
             'year': {'precision@10': [], 'recall@10': [], 'f1@10': []},
             'mixed': {'precision@10': [], 'recall@10': [], 'f1@10': []}
         }
+
+        # Latency per stage and call counts per query
+        stage_latencies = {}
+        total_latencies = []
+        call_counts = {'llm_calls': [], 'index_calls': [], 'embedding_api_calls': []}
+        per_query = []
+
+        # Get search results concurrently; map keeps them in test-case order
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            runs = list(executor.map(self._run_query, [test_case['query'] for test_case in self.test_data]))
+        wall_time = time.perf_counter() - start
         
-        # i=0
-        for test_case in self.test_data:
+        for test_case, (results, trace, total) in zip(self.test_data, runs):
             query = test_case['query']
             relevant = set(test_case['relevant_docs'])
             query_type = test_case['query_type']
             
-            # Get search results
-            results = self.query_processor.search_questions(query)
             retrieved = [self._doc_id_from_meta(match.metadata) for match in results[:20]]
-            # i=i+1
-            # print(f"{i}: retrieved ids: {retrieved}")
             
             # Calculate metrics
             metrics = self._calculate_metrics(retrieved, relevant, query_type)
@@ -134,19 +159,47 @@ class RagEvaluator:
             # Store query type specific metrics
             for metric in ['precision@10', 'recall@10', 'f1@10']:
                 query_type_metrics[query_type][metric].append(metrics[metric])
+
+            # Store latency and call counts
+            total_latencies.append(total)
+            for stage, seconds in trace.stage_totals().items():
+                stage_latencies.setdefault(stage, []).append(seconds)
+            for counter in call_counts:
+                call_counts[counter].append(trace.counters[counter])
+            per_query.append({
+                'query': query,
+                'query_type': query_type,
+                'total_ms': total * 1000,
+                **{metric: float(value) for metric, value in metrics.items()},
+                **trace.to_dict()
+            })
         
         # Calculate averages
         results = {
-            metric: np.mean(values) for metric, values in all_metrics.items()
+            metric: float(np.mean(values)) for metric, values in all_metrics.items()
         }
         
         # Add query type specific results
         results['by_query_type'] = {
             qtype: {
-                metric: np.mean(values) for metric, values in metrics.items()
+                metric: float(np.mean(values)) if values else 0.0 for metric, values in metrics.items()
             }
             for qtype, metrics in query_type_metrics.items()
         }
+
+        # Add latency breakdown and call counts
+        results['latency'] = {
+            'total': latency_summary(total_latencies),
+            'stages': {stage: latency_summary(values) for stage, values in stage_latencies.items()}
+        }
+        results['calls_per_query'] = {
+            counter: {'mean': float(np.mean(values)), 'max': int(max(values))}
+            for counter, values in call_counts.items()
+        }
+        results['workers'] = self.max_workers
+        results['wall_time_s'] = wall_time
+        results['queries_per_second'] = len(self.test_data) / wall_time if wall_time > 0 else 0.0
+        results['per_query'] = per_query
         
         return results
 
@@ -332,7 +385,14 @@ TEST_DATA = [
 
 # Run evaluation
 if __name__ == "__main__":
-    evaluator = RagEvaluator(TEST_DATA)
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency")
+    parser.add_argument("--workers", type=int, default=4, help="queries run concurrently")
+    parser.add_argument("--output", help="write the full report as JSON to this file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    start_exporter()
+    evaluator = RagEvaluator(TEST_DATA, max_workers=args.workers)
     results = evaluator.evaluate()
     
     print("\nOverall Metrics:")
@@ -348,3 +408,15 @@ if __name__ == "__main__":
         print(f"Precision: {metrics['precision@10']:.3f}")
         print(f"Recall: {metrics['recall@10']:.3f}")
         print(f"F1: {metrics['f1@10']:.3f}")
+
+    print("\nLatency (ms):")
+    for stage, summary in [("total", results['latency']['total']), *results['latency']['stages'].items()]:
+        print(f"{stage:>14}: p50 {summary['p50_ms']:.0f}  p95 {summary['p95_ms']:.0f}  p99 {summary['p99_ms']:.0f}")
+    print("\nCalls per query:")
+    for counter, summary in results['calls_per_query'].items():
+        print(f"{counter}: mean {summary['mean']:.2f}, max {summary['max']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nReport written to {args.output}")
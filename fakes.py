@@ -0,0 +1,128 @@
+"""Deterministic offline stand-ins for Gemini and Pinecone.
+
+They let QueryProcessor, ingestion and the benchmarks run without API keys or network:
+
+    HashEmbedder   - drop-in for genai.embed_content (feature-hashed bag of words)
+    ScriptedModel  - drop-in for a GenerativeModel, answering the prompts this repo sends
+    FakeIndex      - LocalIndex with optional simulated round-trip latency
+
+Every stand-in takes latency_ms to simulate network round trips.
+"""
+import re
+import json
+import time
+import zlib
+from types import SimpleNamespace
+import numpy as np
+from local_index import LocalIndex
+from query_rules import parse_query_rules
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _sleep(latency_ms):
+    if latency_ms:
+        time.sleep(latency_ms / 1000)
+
+
+class HashEmbedder:
+    """Deterministic embeddings: each token is hashed to a signed dimension, then L2-normalized.
+
+    Texts sharing words get similar vectors, which is enough for realistic ranking work.
+    """
+
+    def __init__(self, dimension=768, latency_ms=0.0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def vector(self, text: str) -> list:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = zlib.crc32(token.encode("utf-8"))
+            vector[digest % self.dimension] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def __call__(self, model, content, task_type=None, **kwargs):
+        self.calls += 1
+        _sleep(self.latency_ms)
+        if isinstance(content, (list, tuple)):
+            return {"embedding": [self.vector(text) for text in content]}
+        return {"embedding": self.vector(content)}
+
+
+class ScriptedModel:
+    """Answers QueryProcessor prompts (subject, filters, query understanding) and generation prompts.
+
+    Filters come from the local rule parser; subjects from its keyword lists, defaulting to physics.
+    """
+
+    def __init__(self, latency_ms=0.0, subject="physics"):
+        self.latency_ms = latency_ms
+        self.default_subject = subject
+        self.calls = 0
+
+    @staticmethod
+    def _query(prompt: str) -> str:
+        match = re.search(r'Query: "(.*)"', prompt)
+        return match.group(1) if match else ""
+
+    def _understand(self, query: str) -> dict:
+        ruled = parse_query_rules(query) or {"filters": {}, "subject": None}
+        return {
+            "subject": ruled["subject"] or self.default_subject,
+            "filters": ruled["filters"],
+            "search_text": query
+        }
+
+    def _reply(self, prompt: str) -> str:
+        if "Return ONLY one word" in prompt:
+            return self._understand(self._query(prompt))["subject"]
+        if "STRICTLY extract ONLY EXPLICITLY MENTIONED filters" in prompt:
+            understood = self._understand(self._query(prompt))
+            understood.pop("subject")
+            return f"```json\n{json.dumps(understood)}\n```"
+        if "Analyze the O-Level past paper query" in prompt:
+            return json.dumps(self._understand(self._query(prompt)))
+        # Question generation
+        return "\n".join(
+            f"{n}. Generated question {n}?\nA) option one\nB) option two" for n in range(1, 11)
+        )
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        _sleep(self.latency_ms)
+        text = self._reply(prompt)
+        if stream:
+            return iter([SimpleNamespace(text=text[i:i + 40]) for i in range(0, len(text), 40)])
+        return SimpleNamespace(text=text)
+
+
+class FakeIndex(LocalIndex):
+    """In-memory LocalIndex adding latency_ms to every query, upsert and fetch.
+
+    query_calls and payload_bytes (JSON size of the metadata returned by queries) show how
+    much a real index would send back.
+    """
+
+    def __init__(self, dimension=768, latency_ms=0.0):
+        super().__init__(dimension=dimension)
+        self.latency_ms = latency_ms
+        self.query_calls = 0
+        self.payload_bytes = 0
+
+    def query(self, *args, **kwargs):
+        _sleep(self.latency_ms)
+        response = super().query(*args, **kwargs)
+        self.query_calls += 1
+        self.payload_bytes += sum(len(json.dumps(match.metadata, default=str)) for match in response["matches"])
+        return response
+
+    def upsert(self, *args, **kwargs):
+        _sleep(self.latency_ms)
+        return super().upsert(*args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        _sleep(self.latency_ms)
+        return super().fetch(*args, **kwargs)
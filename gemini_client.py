@@ -0,0 +1,190 @@
+"""Shared scheduling of Gemini calls: per-model rate limits, a concurrency cap, retries and
+single-flight coalescing.
+
+Every generate_content and embed_content call in the process goes through one GeminiScheduler,
+so concurrent Streamlit sessions share the quota instead of each running into 429s:
+
+- a token bucket per model holds calls to GEMINI_RPM (GEMINI_EMBED_RPM for embedding models)
+  requests per minute, 0 = unlimited;
+- at most GEMINI_MAX_CONCURRENCY calls are in flight at once;
+- rate-limit and transient server errors are retried with jittered exponential backoff;
+- identical calls already in flight (same model and prompt or texts) wait for that call's
+  result instead of sending another request.
+
+A call that cannot get a slot within GEMINI_MAX_WAIT seconds raises RateLimitExceeded, so
+callers can degrade explicitly rather than wait without bound; BUSY_ERRORS are the errors to
+report as "busy" (503) rather than answer around.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import Future
+from google.api_core import exceptions as google_exceptions
+from metrics import log_event
+from tracing import count, span
+
+# Errors worth retrying: rate limits and transient server trouble
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class RateLimitExceeded(Exception):
+    """No Gemini call slot became free within the scheduler's max_wait"""
+
+
+# Gemini is overloaded right now: no slot, or still rate limited after every retry. Callers
+# surface these as "busy" instead of falling back to a default answer.
+BUSY_ERRORS = (RateLimitExceeded,) + RETRYABLE_ERRORS
+
+
+class TokenBucket:
+    """Allow rate_per_minute calls per minute on average, with bursts of up to burst calls"""
+
+    def __init__(self, rate_per_minute: float, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None) -> float:
+        """Take a token and return how long to wait before using it.
+
+        Raises RateLimitExceeded (taking nothing) if that would be longer than max_wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1.0 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitExceeded(f"Rate limit: next slot in {wait:.1f}s")
+            self._tokens -= 1.0
+            return wait
+
+
+class SingleFlight:
+    """Run a function once per key at a time; concurrent callers with the same key share its result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            count("llm_coalesced")
+            return call.result()
+        try:
+            result = fn()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class GeminiScheduler:
+    """Rate limits, concurrency cap, retries and coalescing shared by every Gemini call"""
+
+    def __init__(self, rpm=None, embed_rpm=None, max_concurrency=None, max_retries=None, base_delay=1.0,
+                 max_wait=None):
+        self.rpm = float(os.getenv("GEMINI_RPM", "1000") if rpm is None else rpm)
+        self.embed_rpm = float(os.getenv("GEMINI_EMBED_RPM", "1500") if embed_rpm is None else embed_rpm)
+        self.max_concurrency = int(max_concurrency or os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+        self.max_retries = int(os.getenv("GEMINI_MAX_RETRIES", "5") if max_retries is None else max_retries)
+        self.base_delay = base_delay
+        self.max_wait = float(os.getenv("GEMINI_MAX_WAIT", "30") if max_wait is None else max_wait)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._single_flight = SingleFlight()
+
+    def bucket(self, model: str):
+        """Token bucket of a model, or None if it is not rate limited"""
+        rpm = self.embed_rpm if "embedding" in model else self.rpm
+        if rpm <= 0:
+            return None
+        with self._buckets_lock:
+            if model not in self._buckets:
+                self._buckets[model] = TokenBucket(rpm)
+            return self._buckets[model]
+
+    def call(self, model: str, fn, /, *args, key=None, **kwargs):
+        """Call fn(*args, **kwargs) within model's limits; calls with the same key are coalesced"""
+        if key is None:
+            return self._call(model, fn, args, kwargs)
+        return self._single_flight.do((model, key), lambda: self._call(model, fn, args, kwargs))
+
+    def _acquire(self, model: str):
+        deadline = time.monotonic() + self.max_wait
+        bucket = self.bucket(model)
+        wait = bucket.reserve(self.max_wait) if bucket is not None else 0.0
+        if wait > 0 or not self._slots.acquire(blocking=False):
+            count("llm_throttled", model=model)
+            with span("llm_wait"):
+                time.sleep(wait)
+                if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    raise RateLimitExceeded(f"{self.max_concurrency} Gemini calls already in flight")
+
+    def _call(self, model, fn, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(model)
+            try:
+                return fn(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                count("llm_retries", model=model)
+                log_event("llm_retry", level=logging.WARNING, model=model, error=e.__class__.__name__,
+                          attempt=attempt + 1, delay=round(delay, 2))
+            finally:
+                self._slots.release()
+            time.sleep(delay)
+
+
+class ScheduledModel:
+    """GenerativeModel (or stand-in) whose generate_content goes through a scheduler.
+
+    Non-streaming calls with the same prompt to the same model are coalesced; streamed
+    responses are consumed by one caller each, so they are only rate limited.
+    """
+
+    def __init__(self, model, scheduler=None, name=None):
+        self.model = model
+        self.scheduler = scheduler or get_scheduler()
+        self.name = name or getattr(model, "model_name", type(model).__name__)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        key = None if stream or kwargs else (id(self), str(prompt))
+        return self.scheduler.call(self.name, self.model.generate_content, prompt, stream=stream, key=key, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GeminiScheduler:
+    """Process-wide scheduler configured from GEMINI_* environment variables"""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = GeminiScheduler()
+        return _default_scheduler
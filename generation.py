@@ -0,0 +1,25 @@
+def create_generation_prompt(results):
+    """Create prompt for question generation based on search results"""
+    examples = []
+    for match in results[:10]:
+        meta = match.metadata
+        example = f"Question: {meta['questionStatement']}\n"
+        options = meta.get('options') or []
+        if isinstance(options, dict):
+            options = list(options.values())
+        if options and 'https' not in options[0]:
+            example += "Options:\n" + "\n".join(options) + "\n"
+        examples.append(example)
+    examples_text = "\n\n".join(examples)
+
+    return f"""You are an expert O level examiner. Create new exam questions similar to these examples:
+
+{examples_text}
+
+Guidelines:
+1. generate 10 questions
+2. Follow O-Level standards
+3. No images or links
+4. Include multiple-choice options when applicable
+6. Make questions original but similar in style to examples
+7. Keep questions clear and self-contained"""
@@ -0,0 +1,149 @@
+import os
+import hashlib
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from tracing import count, span
+
+DEFAULT_IMAGE_CACHE_DIR = os.path.join(".cache", "images")
+DISPLAY_SIZE = (1000, 500)
+
+
+class ImageFetchError(Exception):
+    """Raised when an image cannot be downloaded"""
+
+
+def is_drive_url(url: str) -> bool:
+    return 'drive.google.com' in url
+
+
+def drive_download_url(url: str) -> str:
+    file_id = url.split('/d/')[1].split('/')[0]
+    return f'https://drive.google.com/uc?export=download&id={file_id}'
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageCache:
+    """Disk cache of decoded, resized question images.
+
+    Resized variants are stored once per content hash (blobs/<sha256>_<w>x<h>.png); a small
+    pointer file per source URL (urls/<sha256 of url>) records which content it resolved to,
+    so the same picture linked from several URLs is only stored once. Downloads share one
+    pooled HTTP session.
+    """
+
+    def __init__(self, directory=DEFAULT_IMAGE_CACHE_DIR, size=DISPLAY_SIZE, max_workers=8):
+        self.directory = directory
+        self.size = size
+        self.max_workers = max_workers
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "urls"), exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _url_path(self, url):
+        return os.path.join(self.directory, "urls", _sha256(url.encode("utf-8")))
+
+    def _blob_path(self, content_hash):
+        width, height = self.size
+        return os.path.join(self.directory, "blobs", f"{content_hash}_{width}x{height}.png")
+
+    @staticmethod
+    def _write_atomic(path, data: bytes):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _cached(self, url):
+        try:
+            with open(self._url_path(url), "r", encoding="utf-8") as f:
+                content_hash = f.read().strip()
+            with open(self._blob_path(content_hash), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _download(self, url) -> bytes:
+        download_url = drive_download_url(url) if is_drive_url(url) else url
+        response = self.session.get(download_url, timeout=30)
+        if response.status_code != 200:
+            source = "Google Drive image" if is_drive_url(url) else "image"
+            raise ImageFetchError(f"Failed to load {source} (HTTP {response.status_code})")
+        return response.content
+
+    def get(self, url) -> bytes:
+        """Return PNG bytes of the resized image at url, downloading it on a cache miss"""
+        data = self._cached(url)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            count("cache_hits", cache="image")
+            return data
+        with self._lock:
+            self.misses += 1
+        count("cache_misses", cache="image")
+
+        with span("image_fetch"):
+            raw = self._download(url)
+        content_hash = _sha256(raw)
+        blob_path = self._blob_path(content_hash)
+        if os.path.exists(blob_path):
+            with open(blob_path, "rb") as f:
+                data = f.read()
+        else:
+            image = Image.open(BytesIO(raw))
+            image = image.resize(self.size)
+            buffer = BytesIO()
+            image.save(buffer, format="PNG")
+            data = buffer.getvalue()
+            self._write_atomic(blob_path, data)
+        self._write_atomic(self._url_path(url), content_hash.encode("utf-8"))
+        return data
+
+    def prefetch(self, urls) -> dict:
+        """Fetch many images in parallel; returns {url: bytes or the exception raised}"""
+        urls = list(dict.fromkeys(urls))
+        results = {}
+        if not urls:
+            return results
+
+        def fetch(url):
+            try:
+                return self.get(url)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            for url, result in zip(urls, executor.map(fetch, urls)):
+                results[url] = result
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Process-wide image cache (IMAGE_CACHE_DIR)"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ImageCache(directory=os.getenv("IMAGE_CACHE_DIR", DEFAULT_IMAGE_CACHE_DIR))
+        return _default_cache
@@ -0,0 +1,55 @@
+import os
+from dotenv import load_dotenv
+from local_index import LocalIndex
+from keyword_index import KeywordIndex
+
+load_dotenv()
+
+DEFAULT_LOCAL_INDEX_DIR = os.path.join(".cache", "indexes")
+DEFAULT_KEYWORD_INDEX_DIR = os.path.join(".cache", "keyword_indexes")
+
+
+def get_index_backend() -> str:
+    """Vector index backend from INDEX_BACKEND: "pinecone" (default) or "local" """
+    backend = os.getenv("INDEX_BACKEND", "pinecone").lower()
+    if backend not in ["pinecone", "local"]:
+        raise ValueError(f"Unknown INDEX_BACKEND: {backend}")
+    return backend
+
+
+def open_index(name: str, backend=None, create=False, dimension=768):
+    """Open the named index on the configured backend.
+
+    Local indexes live in LOCAL_INDEX_DIR/<name> and are created empty if missing.
+    With create=True a missing Pinecone index is created (serverless, cosine).
+    """
+    backend = backend or get_index_backend()
+    if backend == "local":
+        directory = os.getenv("LOCAL_INDEX_DIR", DEFAULT_LOCAL_INDEX_DIR)
+        return LocalIndex.open(os.path.join(directory, name), dimension=dimension)
+
+    from pinecone import Pinecone, ServerlessSpec
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+
+    # Create Pinecone index (updated for v6+)
+    if create and name not in pc.list_indexes().names():
+        pc.create_index(
+            name=name,
+            dimension=dimension,  # Match your embedding model
+            metric="cosine",
+            spec=ServerlessSpec(
+                cloud="aws",
+                region="us-east-1"
+            )
+            # metadata_config removed in v6+
+        )
+    return pc.Index(name)
+
+
+def open_keyword_index(name: str) -> KeywordIndex:
+    """Open the local BM25 index kept next to the named vector index, whatever its backend.
+
+    It lives in KEYWORD_INDEX_DIR/<name>.json and is created empty if missing.
+    """
+    directory = os.getenv("KEYWORD_INDEX_DIR", DEFAULT_KEYWORD_INDEX_DIR)
+    return KeywordIndex.open(os.path.join(directory, f"{name}.json"))
@@ -0,0 +1,191 @@
+"""Subjects, papers and the indexes that hold them, loaded from a JSON config file.
+
+indexes.json (or the file named by INDEX_REGISTRY) maps each subject to its syllabus code and
+one index per paper:
+
+    {
+      "default_subject": "physics",
+      "subjects": {
+        "physics": {
+          "subjectCode": "5054",
+          "keywords": ["..."],
+          "indexes": {"Paper 1": "o-level-physics-paper-1",
+                      "Paper 2": {"name": "o-level-physics-paper-2", "backend": "local",
+                                  "variants": ["21", "22"]}}
+        }
+      }
+    }
+
+"variants" lists the paper variants in question IDs (default from the paper number: Paper 2 ->
+21, 22, 23), used to look questions up by reference. Connections are opened on first use and shared by every caller in the process, so subjects
+that are never searched cost nothing at startup.
+"""
+import os
+import json
+import threading
+from dataclasses import dataclass, field
+from index_backends import get_index_backend, open_index, open_keyword_index
+from query_rules import SUBJECT_CODES, SUBJECT_KEYWORDS, paper_variants
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "indexes.json")
+
+
+@dataclass
+class IndexSpec:
+    """One vector index (plus its local keyword index) holding one paper of a subject"""
+    subject: str
+    subject_code: str
+    paper: str
+    name: str
+    backend: str = None  # None = INDEX_BACKEND
+    dimension: int = 768
+    variants: list = None  # None = paper_variants(paper)
+
+    def __post_init__(self):
+        if self.variants is None:
+            self.variants = paper_variants(self.paper)
+        self.variants = [str(variant) for variant in self.variants]
+
+    @property
+    def resolved_backend(self) -> str:
+        return self.backend or get_index_backend()
+
+
+@dataclass
+class SubjectSpec:
+    name: str
+    subject_code: str
+    keywords: list = field(default_factory=list)
+    indexes: list = field(default_factory=list)
+
+
+class IndexRegistry:
+    def __init__(self, subjects, default_subject=None):
+        self.subjects = {subject.name: subject for subject in subjects}
+        if not self.subjects:
+            raise ValueError("Index registry has no subjects")
+        self.default_subject = default_subject or next(iter(self.subjects))
+        if self.default_subject not in self.subjects:
+            raise ValueError(f"Unknown default subject: {self.default_subject}")
+        self._vector_indexes = {}
+        self._keyword_indexes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, config: dict):
+        subjects = []
+        for name, subject in config["subjects"].items():
+            code = str(subject["subjectCode"])
+            specs = []
+            for paper, index in subject.get("indexes", {}).items():
+                if isinstance(index, str):
+                    index = {"name": index}
+                specs.append(IndexSpec(
+                    subject=name,
+                    subject_code=code,
+                    paper=paper,
+                    name=index["name"],
+                    backend=index.get("backend"),
+                    dimension=int(index.get("dimension", 768)),
+                    variants=index.get("variants")
+                ))
+            subjects.append(SubjectSpec(name=name, subject_code=code,
+                                        keywords=list(subject.get("keywords", [])), indexes=specs))
+        return cls(subjects, default_subject=config.get("default_subject"))
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or os.getenv("INDEX_REGISTRY", DEFAULT_REGISTRY_PATH)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def from_indexes(cls, indexes: dict, keyword_indexes=None, subject_codes=None):
+        """Registry over already open index objects ({subject: index}), e.g. stand-ins in benchmarks"""
+        codes = subject_codes or {subject: code for code, subject in SUBJECT_CODES.items()}
+        subjects = []
+        for subject in indexes:
+            spec = IndexSpec(subject=subject, subject_code=codes.get(subject, ""), paper="Paper 1",
+                             name=f"{subject}-paper-1")
+            subjects.append(SubjectSpec(name=subject, subject_code=spec.subject_code, indexes=[spec]))
+        registry = cls(subjects)
+        for subject, index in indexes.items():
+            name = registry.subjects[subject].indexes[0].name
+            registry._vector_indexes[name] = index
+            registry._keyword_indexes[name] = (keyword_indexes or {}).get(subject)
+        return registry
+
+    # Lookups (no connections opened)
+
+    def subject_names(self) -> list:
+        return list(self.subjects)
+
+    def subject_codes(self) -> dict:
+        """{subjectCode: subject}"""
+        return {subject.subject_code: name for name, subject in self.subjects.items() if subject.subject_code}
+
+    def subject_keywords(self) -> dict:
+        """Configured keywords per subject, on top of the built-in query_rules.SUBJECT_KEYWORDS"""
+        return {
+            name: set(SUBJECT_KEYWORDS.get(name, set())) | {keyword.lower() for keyword in subject.keywords}
+            for name, subject in self.subjects.items()
+        }
+
+    def specs(self, subject=None) -> list:
+        """Index specs of one subject (the default subject if unknown), or of every subject"""
+        if subject is None:
+            return [spec for subject in self.subjects.values() for spec in subject.indexes]
+        return self.subjects.get(subject, self.subjects[self.default_subject]).indexes
+
+    def spec(self, name: str) -> IndexSpec:
+        for spec in self.specs():
+            if spec.name == name:
+                return spec
+        raise KeyError(f"No index named {name} in the registry")
+
+    def spec_for_paper(self, subject_code, paper=None) -> IndexSpec:
+        """Index a paper is ingested into: matching subject code and paper name, else the
+        subject's first index"""
+        candidates = [spec for spec in self.specs() if spec.subject_code == str(subject_code)]
+        if not candidates:
+            raise KeyError(f"No index configured for subject code {subject_code}")
+        wanted = " ".join(str(paper or "").split()).lower()
+        for spec in candidates:
+            if " ".join(spec.paper.split()).lower() == wanted:
+                return spec
+        return candidates[0]
+
+    # Connections, opened on first use
+
+    def vector_index(self, name: str, create=False):
+        """Connect to the named index once; create=True creates a missing Pinecone index (ingestion)"""
+        with self._lock:
+            if name not in self._vector_indexes:
+                spec = self.spec(name)
+                self._vector_indexes[name] = open_index(spec.name, backend=spec.backend, create=create,
+                                                        dimension=spec.dimension)
+            return self._vector_indexes[name]
+
+    def keyword_index(self, name: str):
+        with self._lock:
+            if name not in self._keyword_indexes:
+                self._keyword_indexes[name] = open_keyword_index(name)
+            return self._keyword_indexes[name]
+
+    def opened(self) -> list:
+        """Names of the vector indexes connected so far"""
+        with self._lock:
+            return list(self._vector_indexes)
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_registry() -> IndexRegistry:
+    """Process-wide registry loaded from INDEX_REGISTRY (default indexes.json)"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = IndexRegistry.load()
+        return _default_registry
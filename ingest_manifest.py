@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_MANIFEST_PATH = os.path.join(".cache", "ingest_manifest.sqlite3")
+
+
+def paper_key(data) -> str:
+    """Identify a paper the same way its question IDs are prefixed"""
+    return f"{data['subjectCode']}_{data['variant']}_{data['year']}"
+
+
+class IngestManifest:
+    """Records which question IDs are in an index and a hash of what was embedded for each.
+
+    Entries are scoped by namespace (backend and index name) and grouped by paper, so questions
+    that disappear from a paper can be deleted. Entries are written batch by batch, so an
+    interrupted ingestion resumes where it stopped.
+    """
+
+    def __init__(self, namespace: str, path=DEFAULT_MANIFEST_PATH):
+        self.namespace = namespace
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            "namespace TEXT, id TEXT, paper TEXT, hash TEXT, updated_at REAL, "
+            "PRIMARY KEY (namespace, id))"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def record_hash(content: str, metadata: dict, slim=False) -> str:
+        """Hash of what is ingested for a question; slim ingestion hashes differently, so
+        switching it on or off re-ingests every question"""
+        record = {"content": content, "metadata": metadata}
+        if slim:
+            record["slim"] = True
+        payload = json.dumps(record, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def hashes(self, paper: str) -> dict:
+        """Return {id: hash} for every recorded question of a paper"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, hash FROM manifest WHERE namespace = ? AND paper = ?",
+                (self.namespace, paper)
+            ).fetchall()
+        return dict(rows)
+
+    def papers(self) -> set:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT paper FROM manifest WHERE namespace = ?", (self.namespace,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark(self, paper: str, entries):
+        """Record (id, hash) pairs as ingested"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO manifest (namespace, id, paper, hash, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.namespace, doc_id, paper, record_hash, now) for doc_id, record_hash in entries]
+            )
+            self._db.commit()
+
+    def remove(self, ids):
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM manifest WHERE namespace = ? AND id = ?",
+                [(self.namespace, doc_id) for doc_id in ids]
+            )
+            self._db.commit()
@@ -0,0 +1,350 @@
+"""Streaming ingestion of a directory tree of past-paper JSON files.
+
+Stages run concurrently and talk through bounded queues, so memory stays flat however many
+files there are:
+
+    discover files -> parse (worker processes: read once, detect encoding, build records)
+    -> manifest diff + batching -> embed (thread pool) -> upsert (+ keyword index, manifest)
+
+Usage:
+    python ingest_pipeline.py DIR [DIR ...]
+    python ingest_pipeline.py DIR --index o-level-chemistry-paper-1   # only papers for that index
+
+Each paper goes to the index configured in indexes.json for its subject code and paper, as in
+connections.py.
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from embedding_cache import get_default_cache
+from document_store import get_document_store, slim_ingestion_enabled, slim_metadata
+from index_registry import get_registry
+from local_index import LocalIndex
+from ingest_manifest import IngestManifest, paper_key
+from paper_loader import build_question_record, discover_paper_files, load_json_with_encoding
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+
+def parse_paper_file(path, slim=False):
+    """Parse one paper file into (paper, (subjectCode, paper name), [(unique_id, content, metadata, hash), ...]).
+
+    Runs in a worker process, so it only touches the file system.
+    """
+    data = load_json_with_encoding(path)
+    records = []
+    for q in data["questions"]:
+        unique_id, content, metadata = build_question_record(data, q)
+        records.append((unique_id, content, metadata, IngestManifest.record_hash(content, metadata, slim)))
+    return paper_key(data), (str(data["subjectCode"]), data.get("paper")), records
+
+
+class IngestPipeline:
+    """Ingest papers into the registry index of their subject code and paper.
+
+    Passing index and manifest (and optionally keyword_index) sends every paper to that one
+    index instead; only_index restricts a registry run to the papers that belong to one index.
+    """
+
+    def __init__(self, index=None, manifest=None, batch_size=50, embed_workers=4, parse_workers=2,
+                 queue_size=8, force=False, cache=None, keyword_index=None, slim=None, document_store=None,
+                 registry=None, only_index=None, flush_every=None):
+        self.registry = registry
+        self.only_index = only_index
+        # Index name -> (index, manifest, keyword index); None is the single fixed index
+        self._targets = {}
+        if index is not None:
+            self._targets[None] = (index, manifest, keyword_index)
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.force = force
+        # Local indexes rewrite their whole file on flush, so save every flush_every batches
+        # (LOCAL_INDEX_FLUSH_BATCHES) and at the end of a run; their manifest entries are only
+        # written or removed once saved
+        self.flush_every = flush_every or int(os.getenv("LOCAL_INDEX_FLUSH_BATCHES", "20"))
+        self.cache = cache or get_default_cache()
+        # Slim ingestion: filterable fields in the index, full questions in the document store
+        self.slim = slim_ingestion_enabled() if slim is None else slim
+        self.document_store = document_store or (get_document_store() if self.slim else None)
+        # Local index name -> ([upserted batches], [deleted IDs]) not saved yet
+        self._unsaved = {}
+        self._unsaved_lock = threading.Lock()
+        self._error = None
+        self._stats_lock = threading.Lock()
+        self.stats = {"files": 0, "questions": 0, "embedded": 0, "unchanged": 0, "removed": 0, "skipped": 0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+
+    def _target(self, subject_code, paper_name):
+        """Name of the index a paper goes to (None for the fixed index)"""
+        if None in self._targets:
+            return None
+        return (self.registry or get_registry()).spec_for_paper(subject_code, paper_name).name
+
+    def _connect(self, name):
+        """(index, manifest, keyword index) of an index, connecting on first use (producer thread only)"""
+        if name not in self._targets:
+            registry = self.registry or get_registry()
+            spec = registry.spec(name)
+            self._targets[name] = (
+                registry.vector_index(name, create=True),
+                IngestManifest(namespace=f"{spec.resolved_backend}:{name}"),
+                registry.keyword_index(name),
+            )
+        return self._targets[name]
+
+    def _delete(self, name, ids):
+        index, manifest, keyword_index = self._targets[name]
+        index.delete(ids=ids)
+        if keyword_index is not None:
+            keyword_index.delete(ids)
+        if self.document_store is not None:
+            self.document_store.delete(ids)
+        if isinstance(index, LocalIndex):
+            # Forgotten by the manifest only once the index is saved without them
+            self._pending(name, removed=ids)
+        else:
+            manifest.remove(ids)
+        self._count("removed", len(ids))
+
+    def _pending(self, name, batch=None, removed=()) -> int:
+        """Note an unsaved batch or deletes of a local index; returns its unsaved batch count"""
+        with self._unsaved_lock:
+            batches, deleted = self._unsaved.setdefault(name, ([], []))
+            if batch is not None:
+                batches.append(batch)
+            deleted.extend(removed)
+            return len(batches)
+
+    def _save(self, name):
+        """Save a local index, then record what the save made durable in its manifest"""
+        with self._unsaved_lock:
+            batches, removed = self._unsaved.pop(name, ([], []))
+        index, manifest, _ = self._targets[name]
+        index.flush()
+        # An interrupted run re-embeds unsaved questions and deletes unsaved removals again
+        if removed:
+            manifest.remove(removed)
+        self._mark(manifest, batches)
+
+    # Stages
+
+    def _parsed_papers(self, directories):
+        """Yield parse results, keeping at most a few files in flight in the worker pool"""
+        paths = discover_paper_files(directories)
+        if self.parse_workers <= 0:
+            for path in paths:
+                yield path, parse_paper_file(path, self.slim)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            in_flight = deque()
+            for path in paths:
+                in_flight.append((path, pool.submit(parse_paper_file, path, self.slim)))
+                if len(in_flight) >= self.parse_workers * 2:
+                    path, future = in_flight.popleft()
+                    yield path, future.result()
+            while in_flight:
+                path, future = in_flight.popleft()
+                yield path, future.result()
+
+    def _produce(self, directories, batch_queue, seen_papers):
+        """Diff parsed papers against their index's manifest and feed fixed-size batches (one
+        index each) to the embedders"""
+        pending = {}  # index name -> questions waiting for a full batch
+        for path, (paper, (subject_code, paper_name), records) in self._parsed_papers(directories):
+            if self._error is not None:
+                return
+            name = self._target(subject_code, paper_name)
+            if self.only_index is not None and name != self.only_index:
+                print(f"skipping {path}: subject {subject_code} {paper_name or ''} belongs to {name}")
+                self._count("skipped")
+                continue
+            seen_papers.setdefault(name, set()).add(paper)
+            self._count("files")
+            self._count("questions", len(records))
+
+            _, manifest, keyword_index = self._connect(name)
+            known = manifest.hashes(paper)
+            ids = {record[0] for record in records}
+            removed = [unique_id for unique_id in known if unique_id not in ids]
+            if removed:
+                self._delete(name, removed)
+
+            changed = [record for record in records if self.force or known.get(record[0]) != record[3]]
+            if keyword_index is not None:
+                # Unchanged questions only need indexing by keyword
+                changed_ids = {record[0] for record in changed}
+                keyword_index.upsert([
+                    (unique_id, metadata) for unique_id, _, metadata, _ in records
+                    if unique_id not in changed_ids and unique_id not in keyword_index
+                ])
+            self._count("unchanged", len(records) - len(changed))
+            waiting = pending.setdefault(name, [])
+            waiting.extend((paper, *record) for record in changed)
+            while len(waiting) >= self.batch_size:
+                batch_queue.put((name, waiting[:self.batch_size]))
+                del waiting[:self.batch_size]
+        for name, waiting in pending.items():
+            if waiting:
+                batch_queue.put((name, waiting))
+
+    def _embed_worker(self, batch_queue, upsert_queue):
+        while True:
+            item = batch_queue.get()
+            if item is None:
+                return
+            # After a failure keep draining so the producer never blocks on a full queue
+            if self._error is not None:
+                continue
+            name, batch = item
+            try:
+                embeddings = self.cache.embed_many(
+                    [content for _, _, content, _, _ in batch],
+                    model=EMBEDDING_MODEL,
+                    task_type="retrieval_document"
+                )
+                upsert_queue.put((name, batch, embeddings))
+            except Exception as e:
+                self._fail(e)
+
+    @staticmethod
+    def _mark(manifest, batches):
+        by_paper = {}
+        for batch in batches:
+            for paper, unique_id, _, _, record_hash in batch:
+                by_paper.setdefault(paper, []).append((unique_id, record_hash))
+        for paper, entries in by_paper.items():
+            manifest.mark(paper, entries)
+
+    def _upsert_worker(self, upsert_queue):
+        while True:
+            item = upsert_queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            name, batch, embeddings = item
+            index, manifest, keyword_index = self._targets[name]
+            try:
+                if self.slim:
+                    self.document_store.put_many([(unique_id, metadata) for _, unique_id, _, metadata, _ in batch])
+                index.upsert([
+                    (unique_id, embedding, slim_metadata(metadata) if self.slim else metadata)
+                    for (_, unique_id, _, metadata, _), embedding in zip(batch, embeddings)
+                ])
+                if keyword_index is not None:
+                    keyword_index.upsert([(unique_id, metadata) for _, unique_id, _, metadata, _ in batch])
+                if isinstance(index, LocalIndex):
+                    if self._pending(name, batch=batch) >= self.flush_every:
+                        self._save(name)
+                else:
+                    self._mark(manifest, [batch])
+                self._count("embedded", len(batch))
+            except Exception as e:
+                self._fail(e)
+
+    def run(self, directories, prune=False) -> dict:
+        """Ingest every paper under directories; prune=True also deletes papers whose files are gone
+        from the indexes that received papers"""
+        batch_queue = queue.Queue(maxsize=self.queue_size)
+        upsert_queue = queue.Queue(maxsize=self.queue_size)
+        embedders = [
+            threading.Thread(target=self._embed_worker, args=(batch_queue, upsert_queue), daemon=True)
+            for _ in range(self.embed_workers)
+        ]
+        upserter = threading.Thread(target=self._upsert_worker, args=(upsert_queue,), daemon=True)
+        for thread in embedders + [upserter]:
+            thread.start()
+
+        start = time.perf_counter()
+        seen_papers = {}  # index name -> paper keys
+        try:
+            self._produce(directories, batch_queue, seen_papers)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in embedders:
+                batch_queue.put(None)
+            for thread in embedders:
+                thread.join()
+            upsert_queue.put(None)
+            upserter.join()
+
+        if self._error is not None:
+            raise self._error
+
+        for name, papers in seen_papers.items():
+            index, manifest, keyword_index = self._targets[name]
+            if prune:
+                for paper in manifest.papers() - papers:
+                    self._delete(name, list(manifest.hashes(paper)))
+            if keyword_index is not None:
+                keyword_index.flush()
+        # Local indexes with unsaved upserts or deletes, pruned or not
+        for name in list(self._unsaved):
+            self._save(name)
+
+        elapsed = time.perf_counter() - start
+        stats = dict(self.stats)
+        stats["seconds"] = elapsed
+        stats["questions_per_second"] = stats["embedded"] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Ingest past-paper JSON files into a vector index")
+    parser.add_argument("directories", nargs="+", help="directories searched recursively for .json papers")
+    registry = get_registry()
+    parser.add_argument("--index", choices=[spec.name for spec in registry.specs()],
+                        help="only ingest the papers that belong to this index from indexes.json "
+                             "(default: every paper into its own index)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("EMBED_BATCH_SIZE", "50")),
+                        help="texts per embedding call (max 100)")
+    parser.add_argument("--embed-workers", type=int, default=int(os.getenv("EMBED_WORKERS", "4")),
+                        help="embedding batches in flight")
+    parser.add_argument("--parse-workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="worker processes parsing files (0 = parse in this process)")
+    parser.add_argument("--queue-size", type=int, default=8, help="batches buffered between stages")
+    parser.add_argument("--force", action="store_true", help="re-embed questions even if unchanged")
+    parser.add_argument("--prune", action="store_true", help="delete papers whose files are gone")
+    parser.add_argument("--slim-metadata", action="store_true", default=None,
+                        help="keep only filterable fields in the index, full questions in the document store "
+                             "(default SLIM_METADATA)")
+    args = parser.parse_args()
+
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+    pipeline = IngestPipeline(
+        batch_size=args.batch_size,
+        embed_workers=args.embed_workers,
+        parse_workers=args.parse_workers,
+        queue_size=args.queue_size,
+        force=args.force,
+        slim=args.slim_metadata,
+        registry=registry,
+        only_index=args.index
+    )
+    stats = pipeline.run(args.directories, prune=args.prune)
+    print(f"{stats['files']} files, {stats['questions']} questions: {stats['embedded']} embedded, "
+          f"{stats['unchanged']} unchanged, {stats['removed']} removed, {stats['skipped']} files skipped "
+          f"in {stats['seconds']:.1f}s ({stats['questions_per_second']:.1f} questions/s)")
+
+
+if __name__ == "__main__":
+    main()
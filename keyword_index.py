@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+from local_index import Match
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+# Words that say what to search for rather than what to match
+QUERY_STOPWORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "as", "at", "by", "find", "for", "from", "get",
+    "give", "in", "is", "list", "me", "mcq", "mcqs", "of", "on", "or", "paper", "papers", "please",
+    "question", "questions", "related", "show", "some", "the", "to", "topic", "topics", "with",
+}
+
+
+def tokenize(text: str) -> list:
+    """Lowercased terms; hyphenated words like half-life stay one term"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def question_text(metadata: dict) -> str:
+    """Text a question is keyword-indexed by: statement, text options and topics"""
+    parts = [str(metadata.get("questionStatement", ""))]
+    for field in ["options", "topics"]:
+        values = metadata.get(field) or []
+        if isinstance(values, dict):
+            values = values.values()
+        elif isinstance(values, str):
+            values = [values]
+        parts.extend(str(value) for value in values if "https" not in str(value))
+    return "\n".join(parts)
+
+
+def _matches_filter(metadata: dict, filter: dict) -> bool:
+    """Evaluate a Pinecone-style filter ($eq, $in, $ne, $nin, $and) against metadata"""
+    for name, condition in filter.items():
+        if name == "$and":
+            if not all(_matches_filter(metadata, clause) for clause in condition):
+                return False
+            continue
+        value = metadata.get(name)
+        values = {str(v) for v in value} if isinstance(value, (list, tuple)) else {str(value)}
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            operands = {str(v) for v in operand} if op in ["$in", "$nin"] else {str(operand)}
+            hit = name in metadata and bool(values & operands)
+            if op in ["$eq", "$in"] and not hit:
+                return False
+            if op in ["$ne", "$nin"] and hit:
+                return False
+            if op not in ["$eq", "$in", "$ne", "$nin"]:
+                raise ValueError(f"Unsupported filter operator for keyword index: {op}")
+    return True
+
+
+class KeywordIndex:
+    """In-process BM25 inverted index over question statements, options and topics.
+
+    It keeps each question's metadata, so lexical matches can be returned without a vector
+    lookup. save() writes one JSON file; load() rebuilds the postings from it.
+    """
+
+    def __init__(self, path=None, k1=1.2, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._docs = {}  # id -> (term frequencies, length, metadata)
+        self._postings = {}  # term -> {id: term frequency}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    # Persistence
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        index = cls(path=path, k1=stored.get("k1", 1.2), b=stored.get("b", 0.75))
+        for doc_id, doc in stored["docs"].items():
+            index._add(doc_id, Counter(doc["terms"]), doc["metadata"])
+        return index
+
+    @classmethod
+    def open(cls, path):
+        """Load the index at path, or start an empty one that will be saved there"""
+        if os.path.exists(path):
+            return cls.load(path)
+        return cls(path=path)
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            raise ValueError("No path given for saving the keyword index")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            docs = {
+                doc_id: {"terms": terms, "metadata": metadata}
+                for doc_id, (terms, _, metadata) in self._docs.items()
+            }
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"k1": self.k1, "b": self.b, "docs": docs}, f)
+            os.replace(tmp_path, path)
+        self.path = path
+
+    def flush(self):
+        """Save to the index's own path, if it has one"""
+        if self.path:
+            self.save()
+
+    # Writes
+
+    def _add(self, doc_id, terms, metadata):
+        self._remove(doc_id)
+        length = sum(terms.values())
+        self._docs[doc_id] = (terms, length, metadata)
+        self._total_length += length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        terms, length, _ = doc
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def upsert(self, items):
+        """Index (id, metadata) pairs, replacing earlier versions of the same IDs"""
+        with self._lock:
+            for doc_id, metadata in items:
+                self._add(doc_id, Counter(tokenize(question_text(metadata))), metadata)
+
+    def delete(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    # Reads
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def __len__(self):
+        return len(self._docs)
+
+    def topics(self) -> Counter:
+        """How many indexed questions carry each topic"""
+        with self._lock:
+            counts = Counter()
+            for _, _, metadata in self._docs.values():
+                topics = metadata.get("topics") or []
+                counts.update([topics] if isinstance(topics, str) else topics)
+            return counts
+
+    @staticmethod
+    def query_terms(query: str) -> list:
+        """Distinct query terms that carry meaning (search instructions dropped)"""
+        return list(dict.fromkeys(term for term in tokenize(query) if term not in QUERY_STOPWORDS))
+
+    def has_terms(self, terms) -> bool:
+        """True if every term occurs somewhere in the index"""
+        with self._lock:
+            return all(term in self._postings for term in terms)
+
+    def search(self, query: str, top_k=10, filter=None) -> list:
+        """BM25-ranked matches (with metadata) for the query terms, optionally filtered"""
+        with self._lock:
+            n_docs = len(self._docs)
+            if n_docs == 0 or top_k <= 0:
+                return []
+            average_length = self._total_length / n_docs
+            scores = {}
+            for term in self.query_terms(query):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self._docs[doc_id][1]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            matches = []
+            for doc_id, score in ranked:
+                metadata = self._docs[doc_id][2]
+                if filter and not _matches_filter(metadata, filter):
+                    continue
+                matches.append(Match(id=doc_id, score=score, metadata=metadata))
+                if len(matches) >= top_k:
+                    break
+        return matches
@@ -0,0 +1,277 @@
+import os
+import json
+import threading
+from dataclasses import dataclass, field
+import numpy as np
+
+# Metadata fields with precomputed filter masks; other fields are filtered row by row
+INDEXED_FIELDS = ["year", "variant", "questionNumber", "subjectCode", "months"]
+
+
+@dataclass
+class Match:
+    """Query result with the same attributes as a Pinecone ScoredVector"""
+    id: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+    values: list = field(default_factory=list)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+
+@dataclass
+class FetchResponse:
+    """Result of LocalIndex.fetch, shaped like Pinecone's FetchResponse"""
+    vectors: dict = field(default_factory=dict)
+    namespace: str = ""
+
+
+def _as_values(value) -> list:
+    """Metadata values as strings; list fields (months) match if any element matches"""
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+class LocalIndex:
+    """In-process brute-force cosine index with the query/upsert surface of a Pinecone Index.
+
+    Vectors live in one contiguous float32 matrix (rows L2-normalized, so a dot product is the
+    cosine score). save() writes the matrix as .npy plus a JSON metadata file; load() memory-maps
+    the matrix so startup does not read the whole file.
+    """
+
+    def __init__(self, dimension=768, path=None):
+        self.dimension = dimension
+        self.path = path
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        self._count = 0
+        self._ids = []
+        self._metadata = []
+        self._rows = {}
+        # field -> value -> set of rows, used to build filter masks
+        self._postings = {name: {} for name in INDEXED_FIELDS}
+        self._mask_cache = {}
+        self._lock = threading.RLock()
+
+    # Persistence
+
+    @classmethod
+    def load(cls, path):
+        """Open an index saved with save(); the vector matrix is memory-mapped read-only"""
+        with open(os.path.join(path, "metadata.json"), "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        index = cls(dimension=stored["dimension"], path=path)
+        vectors_path = os.path.join(path, "vectors.npy")
+        if stored["ids"]:
+            index._matrix = np.load(vectors_path, mmap_mode="r")
+        index._count = len(stored["ids"])
+        index._ids = stored["ids"]
+        index._metadata = stored["metadata"]
+        index._rows = {doc_id: row for row, doc_id in enumerate(index._ids)}
+        for row, metadata in enumerate(index._metadata):
+            index._post(row, metadata)
+        return index
+
+    @classmethod
+    def open(cls, path, dimension=768):
+        """Load the index at path, or start an empty one that will be saved there"""
+        if os.path.exists(os.path.join(path, "metadata.json")):
+            return cls.load(path)
+        return cls(dimension=dimension, path=path)
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            raise ValueError("No path given for saving the local index")
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            matrix = np.ascontiguousarray(self._matrix[:self._count])
+            tmp_vectors = os.path.join(path, "vectors.tmp.npy")
+            np.save(tmp_vectors, matrix)
+            os.replace(tmp_vectors, os.path.join(path, "vectors.npy"))
+            tmp_metadata = os.path.join(path, "metadata.tmp.json")
+            with open(tmp_metadata, "w", encoding="utf-8") as f:
+                json.dump({"dimension": self.dimension, "ids": self._ids, "metadata": self._metadata}, f)
+            os.replace(tmp_metadata, os.path.join(path, "metadata.json"))
+        self.path = path
+
+    def flush(self):
+        """Save to the index's own path, if it has one (in-memory indexes are left alone)"""
+        if self.path:
+            self.save()
+
+    # Writes
+
+    def _post(self, row, metadata):
+        for name in INDEXED_FIELDS:
+            if name in metadata:
+                for value in _as_values(metadata[name]):
+                    self._postings[name].setdefault(value, set()).add(row)
+
+    def _unpost(self, row, metadata):
+        for name in INDEXED_FIELDS:
+            if name in metadata:
+                for value in _as_values(metadata[name]):
+                    self._postings[name].get(value, set()).discard(row)
+
+    def _ensure_capacity(self, needed):
+        capacity = self._matrix.shape[0]
+        writable = isinstance(self._matrix, np.ndarray) and not isinstance(self._matrix, np.memmap)
+        if needed <= capacity and writable:
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        grown = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+        grown[:self._count] = self._matrix[:self._count]
+        self._matrix = grown
+
+    def upsert(self, vectors, **kwargs):
+        """Insert or overwrite (id, values, metadata) tuples or {"id", "values", "metadata"} dicts"""
+        with self._lock:
+            items = []
+            for vector in vectors:
+                if isinstance(vector, dict):
+                    items.append((vector["id"], vector["values"], vector.get("metadata") or {}))
+                else:
+                    doc_id, values, *rest = vector
+                    items.append((doc_id, values, rest[0] if rest else {}))
+
+            self._ensure_capacity(self._count + len(items))
+            for doc_id, values, metadata in items:
+                values = np.asarray(values, dtype=np.float32)
+                if values.shape != (self.dimension,):
+                    raise ValueError(f"Vector {doc_id} has dimension {values.shape}, expected {self.dimension}")
+                norm = np.linalg.norm(values)
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = self._count
+                    self._count += 1
+                    self._rows[doc_id] = row
+                    self._ids.append(doc_id)
+                    self._metadata.append(metadata)
+                else:
+                    self._unpost(row, self._metadata[row])
+                    self._metadata[row] = metadata
+                self._matrix[row] = values / norm if norm else values
+                self._post(row, metadata)
+            self._mask_cache.clear()
+        return {"upserted_count": len(items)}
+
+    def delete(self, ids=None, **kwargs):
+        """Remove vectors by ID; the last row is moved into each freed slot"""
+        with self._lock:
+            self._ensure_capacity(self._count)
+            for doc_id in ids or []:
+                row = self._rows.pop(doc_id, None)
+                if row is None:
+                    continue
+                self._unpost(row, self._metadata[row])
+                last = self._count - 1
+                if row != last:
+                    moved_id = self._ids[last]
+                    self._unpost(last, self._metadata[last])
+                    self._matrix[row] = self._matrix[last]
+                    self._ids[row] = moved_id
+                    self._metadata[row] = self._metadata[last]
+                    self._rows[moved_id] = row
+                    self._post(row, self._metadata[row])
+                self._ids.pop()
+                self._metadata.pop()
+                self._count -= 1
+            self._mask_cache.clear()
+        return {}
+
+    # Reads
+
+    def _field_mask(self, name, values):
+        key = (name, tuple(sorted(values)))
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = np.zeros(self._count, dtype=bool)
+            if name in self._postings:
+                for value in values:
+                    rows = self._postings[name].get(value)
+                    if rows:
+                        mask[list(rows)] = True
+            else:
+                for row, metadata in enumerate(self._metadata):
+                    if name in metadata and set(_as_values(metadata[name])) & set(values):
+                        mask[row] = True
+            self._mask_cache[key] = mask
+        return mask
+
+    def _filter_mask(self, filter):
+        mask = np.ones(self._count, dtype=bool)
+        for name, condition in filter.items():
+            if name == "$and":
+                for clause in condition:
+                    mask &= self._filter_mask(clause)
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                if op == "$eq":
+                    mask &= self._field_mask(name, _as_values(operand))
+                elif op == "$in":
+                    mask &= self._field_mask(name, [str(v) for v in operand])
+                elif op == "$ne":
+                    mask &= ~self._field_mask(name, _as_values(operand))
+                elif op == "$nin":
+                    mask &= ~self._field_mask(name, [str(v) for v in operand])
+                else:
+                    raise ValueError(f"Unsupported filter operator for local index: {op}")
+        return mask
+
+    def query(self, vector, filter=None, top_k=10, include_metadata=False, include_values=False, **kwargs):
+        """Brute-force cosine search; extra Pinecone arguments (hybrid, alpha, ...) are ignored"""
+        with self._lock:
+            if self._count == 0 or top_k <= 0:
+                return {"matches": [], "namespace": ""}
+            query = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm:
+                query = query / norm
+
+            matrix = self._matrix[:self._count]
+            if filter:
+                rows = np.flatnonzero(self._filter_mask(filter))
+                scores = matrix[rows] @ query
+            else:
+                rows = None
+                scores = matrix @ query
+
+            k = min(top_k, scores.shape[0])
+            if k == 0:
+                return {"matches": [], "namespace": ""}
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            matches = []
+            for position in top:
+                row = int(rows[position]) if rows is not None else int(position)
+                matches.append(Match(
+                    id=self._ids[row],
+                    score=float(scores[position]),
+                    metadata=self._metadata[row] if include_metadata else {},
+                    values=matrix[row].tolist() if include_values else []
+                ))
+        return {"matches": matches, "namespace": ""}
+
+    def fetch(self, ids, **kwargs):
+        """Look vectors up by ID; unknown IDs are left out"""
+        with self._lock:
+            vectors = {}
+            for doc_id in ids:
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    vectors[doc_id] = Match(
+                        id=doc_id,
+                        score=0.0,
+                        metadata=self._metadata[row],
+                        values=self._matrix[row].tolist()
+                    )
+        return FetchResponse(vectors=vectors)
+
+    def describe_index_stats(self):
+        return {"dimension": self.dimension, "total_vector_count": self._count}
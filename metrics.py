@@ -0,0 +1,269 @@
+"""Process-wide metrics and structured logs for the search pipeline.
+
+tracing.span and tracing.count feed the registry below as well as the per-query QueryTrace.
+Metrics are exported in the Prometheus text format over HTTP (METRICS_PORT, path /metrics)
+and/or to a file rewritten every METRICS_FILE_INTERVAL seconds (METRICS_FILE). Events logged
+with log_event are written as JSON lines when LOG_FORMAT=json.
+
+Everything is off unless METRICS_ENABLED=true or an exporter is configured; spans then cost
+one flag check.
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "caie"
+
+# Upper bounds in seconds of the stage duration histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds of size histograms (e.g. texts per embedding batch)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+logger = logging.getLogger("caie_chatbot")
+_json_logs = False
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "false").lower() in ["1", "true", "yes"]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges, per-stage duration histograms and size histograms"""
+
+    def __init__(self, enabled=False, buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # stage -> [count per bucket..., +Inf count, sum]
+        self._sizes = {}  # name -> [count per SIZE_BUCKETS bucket..., +Inf count, sum]
+        self._gauges = {}  # name -> value
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[name] = value
+
+    @staticmethod
+    def _record(histograms, name, buckets, value):
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = [0] * (len(buckets) + 1) + [0.0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(buckets)] += 1
+        histogram[-1] += value
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._record(self._histograms, stage, self.buckets, seconds)
+
+    def observe_size(self, name: str, size: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._record(self._sizes, name, SIZE_BUCKETS, size)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._sizes.clear()
+            self._gauges.clear()
+
+    def snapshot(self) -> dict:
+        """Counters and per-stage count/sum, e.g. for a JSON status page"""
+        with self._lock:
+            return {
+                "counters": {
+                    name + _labels(labels): value for (name, labels), value in self._counters.items()
+                },
+                "stages": {
+                    stage: {"count": sum(histogram[:-1]), "seconds": histogram[-1]}
+                    for stage, histogram in self._histograms.items()
+                },
+                "sizes": {
+                    name: {"count": sum(histogram[:-1]), "sum": histogram[-1]}
+                    for name, histogram in self._sizes.items()
+                },
+                "gauges": dict(self._gauges),
+            }
+
+    @staticmethod
+    def _render_histogram(lines, metric, buckets, histogram, labels=""):
+        separator = "," if labels else ""
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, histogram):
+            cumulative += bucket_count
+            lines.append(f'{metric}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        cumulative += histogram[len(buckets)]
+        lines.append(f'{metric}_bucket{{{labels}{separator}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{metric}_sum{suffix} {histogram[-1]}")
+        lines.append(f"{metric}_count{suffix} {cumulative}")
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                by_name.setdefault(name, []).append((labels, value))
+            for name, series in by_name.items():
+                metric = f"{PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{_labels(labels)} {value}" for labels, value in series)
+
+            if self._histograms:
+                metric = f"{PREFIX}_stage_duration_seconds"
+                lines.append(f"# HELP {metric} Wall time of search pipeline stages")
+                lines.append(f"# TYPE {metric} histogram")
+                for stage, histogram in sorted(self._histograms.items()):
+                    self._render_histogram(lines, metric, self.buckets, histogram, f'stage="{_escape(stage)}"')
+
+            for name, histogram in sorted(self._sizes.items()):
+                metric = f"{PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                self._render_histogram(lines, metric, SIZE_BUCKETS, histogram)
+
+            for name, value in sorted(self._gauges.items()):
+                metric = f"{PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Atomically write the Prometheus text to path (e.g. for node_exporter's textfile collector)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry(enabled=_env_flag("METRICS_ENABLED"))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def log_event(event: str, level=logging.INFO, **fields):
+    """Log an event with structured fields (one JSON line with LOG_FORMAT=json)"""
+    if not logger.isEnabledFor(level):
+        return
+    if _json_logs:
+        logger.log(level, event, extra={"fields": fields})
+    else:
+        details = " ".join(f"{name}={value}" for name, value in fields.items())
+        logger.log(level, f"{event} {details}".strip())
+
+
+def configure_logging(json_format=None, level=None):
+    """Attach a stderr handler to the caie_chatbot logger (LOG_FORMAT=json|text, LOG_LEVEL)"""
+    global _json_logs
+    if json_format is None:
+        json_format = os.getenv("LOG_FORMAT", "text").lower() == "json"
+    handler = logging.StreamHandler()
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.handlers = [handler]
+    logger.setLevel(level or os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+    _json_logs = json_format
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/metrics", "/"]:
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporter_lock = threading.Lock()
+_exporters = {}
+
+
+def start_exporter(port=None, path=None, interval=None) -> dict:
+    """Enable metrics and start the HTTP and/or file exporters once per process.
+
+    Arguments default to METRICS_PORT, METRICS_FILE and METRICS_FILE_INTERVAL (15 s);
+    LOG_FORMAT/LOG_LEVEL configure structured logging on the first call.
+    """
+    port = port if port is not None else int(os.getenv("METRICS_PORT", "0"))
+    path = path if path is not None else os.getenv("METRICS_FILE", "")
+    interval = interval if interval is not None else float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+
+    with _exporter_lock:
+        if not _exporters:
+            configure_logging()
+            _exporters["started"] = True
+        if port or path or _env_flag("METRICS_ENABLED"):
+            registry.enabled = True
+
+        if port and "http" not in _exporters:
+            server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            _exporters["http"] = server
+            log_event("metrics_http_started", port=server.server_address[1])
+
+        if path and "file" not in _exporters:
+            def write_periodically():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        registry.write(path)
+                    except OSError as e:
+                        log_event("metrics_write_failed", level=logging.WARNING, path=path, error=str(e))
+
+            threading.Thread(target=write_periodically, name="metrics-file", daemon=True).start()
+            atexit.register(registry.write, path)
+            _exporters["file"] = path
+        return dict(_exporters)
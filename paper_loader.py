@@ -0,0 +1,69 @@
+import os
+import json
+
+# Tried in order; latin1 decodes any byte sequence, so it is the last resort
+ENCODINGS = ["utf-8-sig", "utf-8", "latin1"]
+
+
+def detect_encoding(raw: bytes) -> str:
+    """Pick the encoding of a paper file from its bytes, without re-reading the file"""
+    for encoding in ENCODINGS:
+        if encoding == "utf-8-sig" and not raw.startswith(b"\xef\xbb\xbf"):
+            continue
+        try:
+            raw.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("Could not decode data with any supported encoding")
+
+
+def load_json_with_encoding(filepath):
+    """Read a paper file once, detect its encoding and parse it"""
+    with open(filepath, "rb") as f:
+        raw = f.read()
+    try:
+        encoding = detect_encoding(raw)
+    except ValueError:
+        raise ValueError(f"Could not decode {filepath} with any supported encoding")
+    return json.loads(raw.decode(encoding))
+
+
+def discover_paper_files(directories):
+    """Yield every .json file under the given directories, in a stable order"""
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith(".json"):
+                    yield os.path.join(root, file)
+
+
+def build_question_record(data, q):
+    """Return (unique_id, embedding text, metadata) for one question of a paper"""
+    unique_id = f"{data['subjectCode']}_{data['variant']}_{data['year']}_q{q['questionNumber']}"
+    # content=q['statement'],
+    content = f"""
+            Exam: {data['exam']}
+            Paper: {data['paper']}
+            Year: {data['year']}
+            Question: {q['statement']}
+            Topics: {', '.join(q['topics'])}
+            """
+    months_part, year = data['year'].split()
+    months = months_part.split('/')
+    metadata = {
+        "exam": data["exam"],
+        "subjectCode": data["subjectCode"],
+        "variant": data["variant"],
+        "year": year,
+        "months":months,
+        "subject": data["subject"],
+        "paper": data["paper"],
+        "questionNumber": q["questionNumber"],
+        "questionStatement": q["statement"],
+        "options": q["options"],
+        "topics": q["topics"],
+        "image": q["image"]
+    }
+    return unique_id, content, metadata
@@ -1,24 +1,156 @@
+"""Search past papers from the command line, one query or a whole batch.
+
+    python query_past_papers.py "Find questions on magnetism"
+    python query_past_papers.py --batch queries.txt --workers 8 --output results.jsonl
+    cat queries.txt | python query_past_papers.py --batch - --order completion
+
+Batch files hold one query per line (or JSON objects with a "query" key); blank lines and lines
+starting with # are skipped, as are malformed JSON lines (reported on stderr). Each query is
+written as one JSON line, in input order or as soon as it completes; repeated queries are
+searched once while their results are among the last 1024 kept. Throughput and the slowest
+queries are reported on stderr.
+"""
 import os
+import sys
+import json
+import time
+import heapq
+import logging
+import argparse
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-from pinecone import Pinecone
 from query_processor import QueryProcessor
+from metrics import logger, start_exporter
+from result_cache import normalize_query
 
-def initialize_pinecone():
-    """Initialize and return Pinecone index connection"""
-    load_dotenv()
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    return pc.Index("o-level-physics-paper-1")
 
-def main():
-    # Initialize services
-    index = initialize_pinecone()
-    query_processor = QueryProcessor(index)
-    
-    # Example search
-    query = "Find questions on magnetism"
-    results = query_processor.search_questions(query)
-    
-    # Display results
+def read_queries(stream, errors=None):
+    """Yield queries from a text or JSONL stream.
+
+    JSON lines that are not an object with a string "query" are skipped; (line number, reason)
+    is appended to errors if given.
+    """
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            try:
+                query = json.loads(line).get("query")
+                if not isinstance(query, str):
+                    raise ValueError("no string 'query' field")
+            except (ValueError, AttributeError) as e:
+                if errors is not None:
+                    errors.append((number, str(e)))
+                continue
+            line = query.strip()
+            if not line:
+                continue
+        yield line
+
+
+def match_record(match, fields=None) -> dict:
+    metadata = match.metadata if fields is None else {f: match.metadata[f] for f in fields if f in match.metadata}
+    return {"id": match.id, "score": match.score, "metadata": metadata}
+
+
+def run_batch(query_processor, queries, out, workers=8, order="input", fields=None, top_k=10,
+              relevance_threshold=0.5, max_results=50, slowest=5, dedup_size=1024) -> dict:
+    """Search every query with at most `workers` in parallel and write one JSON line per query.
+
+    Queries equal after normalization share one search while it runs, and its results while
+    they are among the dedup_size most recently used (failed searches are not reused). At most 2 * workers searches are queued
+    ahead, so the input can be a stream of any length.
+    """
+    def search(query):
+        start = time.perf_counter()
+        try:
+            matches, error = query_processor.search_questions(query, top_k, relevance_threshold, max_results), None
+        except Exception as e:
+            matches, error = [], str(e)
+        return matches, error, time.perf_counter() - start
+
+    running = {}  # normalized query -> future of its search
+    keys = {}  # future -> normalized query
+    waiting = {}  # future -> [(position, query), ...] still to be written
+    recent = OrderedDict()  # normalized query -> (matches, error, seconds), least recently used first
+    in_flight = set()
+    buffered = {}  # position -> line, for input order
+    next_position = 0
+    timings = []
+    stats = {"queries": 0, "unique": 0, "errors": 0}
+
+    def write(position, line):
+        nonlocal next_position
+        if order == "completion":
+            out.write(line + "\n")
+            return
+        buffered[position] = line
+        while next_position in buffered:
+            out.write(buffered.pop(next_position) + "\n")
+            next_position += 1
+
+    def emit(position, query, result, duplicate):
+        matches, error, seconds = result
+        record = {"position": position, "query": query, "seconds": round(seconds, 4), "duplicate": duplicate,
+                  "results": [match_record(match, fields) for match in matches]}
+        if error is not None:
+            record["error"] = error
+        write(position, json.dumps(record, default=str))
+
+    def collect(block=True):
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED) if block else (
+            [future for future in in_flight if future.done()], None)
+        for future in done:
+            in_flight.discard(future)
+            key = keys.pop(future)
+            del running[key]
+            result = future.result()
+            # Failures (e.g. a busy 503) are searched again when the query comes back
+            if result[1] is None:
+                recent[key] = result
+                if len(recent) > dedup_size:
+                    recent.popitem(last=False)
+            stats["errors"] += result[1] is not None
+            requests = waiting.pop(future)
+            timings.append((result[2], requests[0][1]))
+            for i, (position, query) in enumerate(requests):
+                emit(position, query, result, duplicate=i > 0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-query") as executor:
+        for position, query in enumerate(queries):
+            stats["queries"] += 1
+            key = normalize_query(query)
+            if key in running:
+                waiting[running[key]].append((position, query))
+            elif key in recent:
+                recent.move_to_end(key)
+                emit(position, query, recent[key], duplicate=True)
+            else:
+                while len(in_flight) >= 2 * workers:
+                    collect()
+                future = running[key] = executor.submit(search, query)
+                keys[future] = key
+                waiting[future] = [(position, query)]
+                in_flight.add(future)
+                stats["unique"] += 1
+            collect(block=False)
+        while in_flight:
+            collect()
+    out.flush()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    stats["queries_per_second"] = stats["queries"] / elapsed if elapsed > 0 else 0.0
+    stats["slowest"] = [
+        {"query": query, "seconds": round(seconds, 4)} for seconds, query in heapq.nlargest(slowest, timings)
+    ]
+    return stats
+
+
+def print_results(query, results):
     print(f"Results for: '{query}'\n")
     for i, match in enumerate(results, 1):
         meta = match.metadata
@@ -30,5 +162,61 @@ def main():
         print(f"   options: {meta['options']}")
         # print(f"   Score: {match.score:.3f}\n")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Search O-Level past papers")
+    parser.add_argument("query", nargs="?", default="Find questions on magnetism", help="query for a single search")
+    parser.add_argument("--batch", metavar="FILE", help="file of queries to run as a batch (- = stdin)")
+    parser.add_argument("--output", help="JSONL output file for --batch (default stdout)")
+    parser.add_argument("--workers", type=int, default=8, help="searches run in parallel")
+    parser.add_argument("--order", choices=["input", "completion"], default="input",
+                        help="write batch results in input order or as they complete")
+    parser.add_argument("--fields", help="comma-separated metadata fields to include (default all)")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--max-results", type=int, default=50)
+    parser.add_argument("--relevance-threshold", type=float, default=0.5)
+    parser.add_argument("--fake", type=int, metavar="N", help="search N synthetic questions on offline stand-ins")
+    args = parser.parse_args()
+
+    # Initialize services (indexes from indexes.json connect on first use)
+    load_dotenv()
+    start_exporter()
+    if args.batch and not os.getenv("LOG_LEVEL"):
+        # One log line per search would bury the summary
+        logger.setLevel(logging.WARNING)
+    if args.fake:
+        from search_service import fake_services
+        query_processor, _ = fake_services(args.fake)
+    else:
+        query_processor = QueryProcessor()
+
+    if not args.batch:
+        results = query_processor.search_questions(args.query, args.top_k, args.relevance_threshold,
+                                                   args.max_results)
+        print_results(args.query, results)
+        return
+
+    fields = [field.strip() for field in args.fields.split(",") if field.strip()] if args.fields else None
+    source = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    skipped = []
+    try:
+        stats = run_batch(query_processor, read_queries(source, skipped), out, workers=args.workers, order=args.order,
+                          fields=fields, top_k=args.top_k, relevance_threshold=args.relevance_threshold,
+                          max_results=args.max_results)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{stats['queries']} queries ({stats['unique']} unique, {stats['errors']} failed) "
+          f"in {stats['seconds']:.1f}s ({stats['queries_per_second']:.1f} queries/s)", file=sys.stderr)
+    for number, reason in skipped:
+        print(f"  skipped line {number}: {reason}", file=sys.stderr)
+    for slow in stats["slowest"]:
+        print(f"  {slow['seconds'] * 1000:.0f} ms  {slow['query']}", file=sys.stderr)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
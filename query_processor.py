@@ -1,30 +1,213 @@
 import os
 import json
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import google.generativeai as genai
 from google.generativeai import GenerativeModel
 import pinecone
+from query_rules import parse_query_rules, reference_ids
+from local_index import Match
+from tracing import QueryTrace, count, count_llm_usage, current_trace, span
+from metrics import log_event, logger, registry
+from embedding_cache import EmbeddingBatcher, embed_batch, get_default_cache
+from document_store import get_document_store
+from gemini_client import BUSY_ERRORS, ScheduledModel, get_scheduler
+from semantic_cache import SemanticQueryCache
+from subject_router import SubjectRouter
+from index_registry import IndexRegistry, get_registry
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+FILTER_FIELDS = ["questionNumber", "variant", "subjectCode", "year", "months"]
+
+# Reciprocal rank fusion constant (score = sum of 1 / (RRF_K + rank) over the ranked lists)
+RRF_K = 60
+# Queries of at most this many meaningful terms, all in the keyword index, skip the embedding
+LEXICAL_MAX_TERMS = 2
+
+def query_understanding_schema(subjects) -> dict:
+    """Response schema for the single "query understanding" call. Gemini returns
+    JSON that already matches this shape, so no markdown fences need stripping."""
+    return {
+        "type": "object",
+        "properties": {
+            "subject": {"type": "string", "enum": list(subjects)},
+            "filters": {
+                "type": "object",
+                "properties": {field: {"type": "string"} for field in FILTER_FIELDS}
+            },
+            "search_text": {"type": "string"}
+        },
+        "required": ["subject", "filters", "search_text"]
+    }
+
+
+def _quoted(subjects) -> str:
+    return ", ".join(f'"{subject}"' for subject in subjects)
+
+def run_sync(coro):
+    """Run a coroutine to completion from synchronous code, even if this thread already has a loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
 
 class QueryProcessor:
-    def __init__(self, physics_index, chemistry_index):
+    def __init__(self, physics_index=None, chemistry_index=None, query_mode=None, use_rules=None,
+                 embedding_cache=None, retrieval_mode=None, exact_lookup=None, model=None, keyword_indexes=None,
+                 dense_top_k=None, semantic_cache=None, subject_router=None, use_router=None, registry=None,
+                 scheduler=None, document_store=None):
         # Load environment variables first
-        self.physics_index = physics_index
-        self.chemistry_index = chemistry_index
         load_dotenv()
-        
-        # Configure with explicit error handling
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-            
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
 
-    def classify_subject(self, query: str) -> str:
-        """Determine if the query is about physics or chemistry"""
+        # Subjects and their per-paper indexes (indexes.json), connected on first use. Passing
+        # physics_index/chemistry_index (and keyword_indexes) wraps those objects instead.
+        if registry is None and (physics_index is not None or chemistry_index is not None):
+            registry = IndexRegistry.from_indexes(
+                {subject: index for subject, index in
+                 [("physics", physics_index), ("chemistry", chemistry_index)] if index is not None},
+                keyword_indexes
+            )
+        self.registry = registry or get_registry()
+        self.subjects = self.registry.subject_names()
+        self.default_subject = self.registry.default_subject
+        self.subject_codes = self.registry.subject_codes()
+        self.subject_keywords = self.registry.subject_keywords()
+
+        # "single" = one structured call for subject + filters, "legacy" = classify_subject + parse_query
+        self.query_mode = query_mode or os.getenv("QUERY_UNDERSTANDING_MODE", "single")
+        if self.query_mode not in ["single", "legacy"]:
+            raise ValueError(f"Unknown query mode: {self.query_mode}")
+
+        if model is not None:
+            # Stand-in model (e.g. fakes.ScriptedModel) answering every prompt; no API key needed
+            self.model = model
+            self.understanding_model = model
+        else:
+            # Configure with explicit error handling
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY not found in environment variables")
+
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.understanding_model = genai.GenerativeModel(
+                'gemini-1.5-flash',
+                generation_config=genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=query_understanding_schema(self.subjects)
+                )
+            )
+
+        # Calls share the process-wide rate limits, retries and coalescing of identical prompts
+        # (gemini_client), so a burst of sessions waits for quota instead of falling back.
+        # Models that are already scheduled keep their scheduler rather than going through two.
+        self.scheduler = scheduler or get_scheduler()
+        if not isinstance(self.model, ScheduledModel):
+            self.model = ScheduledModel(self.model, self.scheduler)
+        if not isinstance(self.understanding_model, ScheduledModel):
+            self.understanding_model = ScheduledModel(self.understanding_model, self.scheduler)
+
+        # Local rule-based parser answers simple queries without any LLM call
+        if use_rules is None:
+            use_rules = os.getenv("QUERY_RULES_FAST_PATH", "true").lower() != "false"
+        self.use_rules = use_rules
+        self.parse_paths = Counter()
+        self._parse_paths_lock = threading.Lock()
+
+        # "single" = one bounded query for unfiltered searches, "doubling" = legacy growing top_k loop
+        self.retrieval_mode = retrieval_mode or os.getenv("RETRIEVAL_MODE", "single")
+        if self.retrieval_mode not in ["single", "doubling"]:
+            raise ValueError(f"Unknown retrieval mode: {self.retrieval_mode}")
+
+        # Queries naming subject code, year and question number are fetched by ID
+        if exact_lookup is None:
+            exact_lookup = os.getenv("EXACT_REFERENCE_LOOKUP", "true").lower() != "false"
+        self.exact_lookup = exact_lookup
+
+        # Local BM25 index next to each vector index (keyword_index.KeywordIndex), fused with the
+        # dense results; with them the dense query only needs KEYWORD_DENSE_TOP_K matches for the same recall
+        self.keyword_search = os.getenv("KEYWORD_SEARCH", "true").lower() != "false"
+        self.dense_top_k = dense_top_k or int(os.getenv("KEYWORD_DENSE_TOP_K", "20"))
+
+        # Query embeddings are cached (in memory + on disk) and shared with ingestion
+        self.embedding_cache = embedding_cache or get_default_cache()
+
+        # Query embeddings missing from the cache are sent in batches gathered from every session
+        # over QUERY_EMBED_BATCH_WINDOW_MS (0 = one request per query)
+        self.embedding_batcher = EmbeddingBatcher(
+            lambda texts: embed_batch(texts, EMBEDDING_MODEL, "retrieval_query", embed_fn=self.embedding_cache.embed_fn,
+                                      scheduler=self.embedding_cache.scheduler),
+            window_ms=float(os.getenv("QUERY_EMBED_BATCH_WINDOW_MS", "2")),
+            max_batch=int(os.getenv("QUERY_EMBED_MAX_BATCH", "32"))
+        )
+
+        # Results of near-duplicate queries (same filters, embeddings within SEMANTIC_CACHE_DISTANCE)
+        if semantic_cache is None and os.getenv("SEMANTIC_CACHE", "true").lower() != "false":
+            semantic_cache = SemanticQueryCache(
+                max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1024")),
+                max_distance=float(os.getenv("SEMANTIC_CACHE_DISTANCE", "0.07")),
+                ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "600"))
+            )
+        self.semantic_cache = semantic_cache
+
+        # Subjects the rules cannot place are routed by query embedding instead of classify_subject;
+        # below SUBJECT_ROUTER_MIN_CONFIDENCE every subject is searched
+        if use_router is None:
+            use_router = os.getenv("SUBJECT_ROUTER", "true").lower() != "false"
+        self.use_router = use_router or subject_router is not None
+        self.subject_router = subject_router
+        self.router_min_confidence = float(os.getenv("SUBJECT_ROUTER_MIN_CONFIDENCE", "0.03"))
+        self._router_lock = threading.Lock()
+        # A failed build is not retried for SUBJECT_ROUTER_RETRY_SECONDS; until then every subject is searched
+        self.router_retry_seconds = float(os.getenv("SUBJECT_ROUTER_RETRY_SECONDS", "60"))
+        self._router_failure = None  # (monotonic time, error) of the last failed build
+
+        # Full questions of slim indexes (ingested with SLIM_METADATA), read only for returned results
+        self.document_store = document_store
+
+        # Blocking SDK calls (Gemini, embeddings, index queries) run here so they can overlap
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="query-processor")
+
+    async def _in_thread(self, fn, *args):
+        # Carry the context over so tracing spans inside fn land in the caller's trace
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, fn, *args)
+
+    def _generate(self, model, stage: str, prompt: str):
+        with span(stage):
+            count("llm_calls", stage=stage)
+            response = model.generate_content(prompt)
+        count_llm_usage(response)
+        return response
+
+    @staticmethod
+    def _fallback(stage: str, error: Exception):
+        """Record that a stage failed and its default answer was used"""
+        count("fallbacks", stage=stage)
+        log_event("fallback", level=logging.WARNING, stage=stage, error=str(error))
+
+    def _embed_query(self, query: str):
+        with span("embed"):
+            return self.embedding_cache.embed(query, EMBEDDING_MODEL, "retrieval_query", batcher=self.embedding_batcher)
+
+    def _query_index(self, index, **kwargs):
+        with span("vector_query"):
+            count("index_calls")
+            return index.query(**kwargs)
+
+    def _classify(self, query: str) -> str:
+        """Ask Gemini which subject the query is about; raises if the call fails"""
         prompt = f"""
-        Analyze the following query and determine if it's about physics or chemistry.
-        Return ONLY one word: either "physics" or "chemistry".
+        Analyze the following query and determine which O-Level subject it is about.
+        Return ONLY one word: one of {_quoted(self.subjects)}.
         
         Query: "{query}"
         
@@ -33,25 +216,83 @@ class QueryProcessor:
         2. Topic areas (e.g., mechanics, electricity for physics; reactions, elements for chemistry)
         3. Context clues
         
-        If the query could be about either subject or is unclear, return "physics" as default.
+        If the query could be about several subjects or is unclear, return "{self.default_subject}" as default.
+        """
+        response = self._generate(self.model, "classify", prompt)
+        subject = response.text.strip().lower()
+        return subject if subject in self.subjects else self.default_subject
+
+    def classify_subject(self, query: str) -> str:
+        """Determine which subject the query is about (the default subject if Gemini fails).
+
+        BUSY_ERRORS (Gemini overloaded) are raised, not answered with the default.
         """
-        
         try:
-            response = self.model.generate_content(prompt)
-            subject = response.text.strip().lower()
-            return subject if subject in ["physics", "chemistry"] else "physics"
+            return self._classify(query)
+        except BUSY_ERRORS:
+            raise
         except Exception as e:
-            print(f"Error classifying subject: {str(e)}")
-            return "physics"  # Default to physics on error
+            self._fallback("classify", e)
+            return self.default_subject
 
     def get_appropriate_index(self, subject: str):
-        """Return the appropriate index based on subject"""
-        return self.physics_index if subject == "physics" else self.chemistry_index
+        """Return the subject's (first paper's) vector index, connecting on first use"""
+        return self.registry.vector_index(self.registry.specs(subject)[0].name)
+
+    def get_keyword_index(self, name: str):
+        """Return the keyword index next to the named vector index, or None if it is empty or disabled"""
+        if not self.keyword_search:
+            return None
+        keyword_index = self.registry.keyword_index(name)
+        return keyword_index if keyword_index is not None and len(keyword_index) else None
+
+    def get_keyword_indexes(self, subject: str) -> list:
+        """Non-empty keyword indexes of every paper of a subject"""
+        keyword_indexes = [self.get_keyword_index(spec.name) for spec in self.registry.specs(subject)]
+        return [keyword_index for keyword_index in keyword_indexes if keyword_index is not None]
+
+    def _is_lexical(self, query: str, ruled) -> bool:
+        """True for short filter-free queries (e.g. "half-life") whose terms all occur in a keyword index"""
+        if ruled is None or ruled["filters"]:
+            return False
+        subjects = [ruled["subject"]] if ruled["subject"] else self.subjects
+        for subject in subjects:
+            for keyword_index in self.get_keyword_indexes(subject):
+                terms = keyword_index.query_terms(query)
+                if 0 < len(terms) <= LEXICAL_MAX_TERMS and keyword_index.has_terms(terms):
+                    return True
+        return False
+
+    def _keyword_search(self, keyword_index, query: str, filters: dict, limit: int) -> list:
+        with span("keyword_query"):
+            count("keyword_calls")
+            return keyword_index.search(query, top_k=limit, filter=filters or None)
+
+    @staticmethod
+    def _fuse(ranked_lists, limit: int) -> list:
+        """Reciprocal rank fusion; the fused score replaces each match's own score.
+
+        Every search result is scored this way (sum of 1 / (RRF_K + rank) over the dense and
+        keyword lists of each paper index that returned it), so scores are comparable across
+        papers and subjects whatever mix of BM25 and cosine produced the lists.
+        """
+        scores = {}
+        matches = {}
+        for ranked in ranked_lists:
+            for rank, match in enumerate(ranked, 1):
+                scores[match.id] = scores.get(match.id, 0.0) + 1.0 / (RRF_K + rank)
+                matches.setdefault(match.id, match)
+        fused = sorted(scores, key=scores.get, reverse=True)[:limit]
+        return [Match(id=doc_id, score=scores[doc_id], metadata=matches[doc_id].metadata) for doc_id in fused]
+
+    @staticmethod
+    def _format_filters(filters: dict) -> dict:
+        """Format extracted filters for Pinecone compatibility"""
+        return {k: {"$eq": v} for k, v in filters.items() if v not in (None, "")}
 
     def parse_query(self, query: str) -> dict:
-        """Extract filters and search text using Gemini"""
-        model = genai.GenerativeModel('gemini-1.5-flash')  # Updated model name
-        
+        """Extract filters and search text using Gemini (no filters if its answer is unusable;
+        BUSY_ERRORS are raised)"""
         prompt = f"""
         Analyze the query and STRICTLY extract ONLY EXPLICITLY MENTIONED filters:
         - questionNumber: extract as string if specifically numbered,
@@ -97,7 +338,7 @@ class QueryProcessor:
         """
         
         try:
-            response = model.generate_content(prompt)
+            response = self._generate(self.model, "parse", prompt)
             # print("Raw response:", response.text)
             
             # Extract JSON from markdown code block
@@ -107,34 +348,373 @@ class QueryProcessor:
             # print(parsed_filters)
             # Format filters for Pinecone compatibility
             return {
-                "filters": {
-                    **{k: {"$eq": v} for k, v in parsed_filters.get("filters", {}).items() if v is not None}
-                },
+                "filters": self._format_filters(parsed_filters.get("filters", {})),
                 "search_text": parsed_filters.get("search_text", "")
             }
+        except BUSY_ERRORS:
+            raise
         except Exception as e:
-            print(f"Error parsing query: {str(e)}")
+            self._fallback("parse", e)
             return {"filters": {}, "search_text": query}
 
-    def search_questions(self, query: str, top_k=10, relevance_threshold=0.5) -> list:
-        """Search Pinecone with query filters and semantic search"""
-        # First classify the subject
-        subject = self.classify_subject(query)
-        index = self.get_appropriate_index(subject)
-        
-        parsed = self.parse_query(query)
+    def understand_query(self, query: str) -> dict:
+        """Classify subject and extract filters and search text in one structured Gemini call.
+
+        An unusable answer falls back to no filters; BUSY_ERRORS are raised, since searching
+        without the query's filters would quietly return the wrong questions.
+        """
+        prompt = f"""
+        Analyze the O-Level past paper query below and return:
+        - subject: one of {_quoted(self.subjects)}. If the query could be about several subjects or is unclear, use "{self.default_subject}".
+        - filters: ONLY filters EXPLICITLY MENTIONED in the query, omit every other key:
+            - questionNumber: question number as string
+            - variant: version/variant as string (e.g. "12")
+            - subjectCode: 4-digit code as string (e.g. "5054")
+            - year: full year as string; expand 2-digit years (19 -> 2019), "recent" means present year - 2
+            - months: full month name (Nov -> November); if several months are given take only one
+        - search_text: the full original query
+
+        Query: "{query}"
+        """
+
+        try:
+            response = self._generate(self.understanding_model, "understand", prompt)
+            understood = json.loads(response.text)
+            filters = understood.get("filters") or {}
+            if not isinstance(filters, dict):
+                raise ValueError(f"Expected filters object, got {type(filters).__name__}")
+            subject = str(understood.get("subject", "")).strip().lower()
+            return {
+                "subject": subject if subject in self.subjects else None,
+                "filters": self._format_filters(
+                    {k: str(v) for k, v in filters.items() if k in FILTER_FIELDS}
+                ),
+                "search_text": understood.get("search_text") or query
+            }
+        except BUSY_ERRORS:
+            raise
+        except Exception as e:
+            self._fallback("understand", e)
+            return {"subject": None, "filters": {}, "search_text": query}
+
+    def get_subject_router(self):
+        """The embedding router, built on first use from syllabus keywords and indexed topics.
+
+        After a failed build, calls raise without rebuilding for router_retry_seconds.
+        """
+        if self.subject_router is None:
+            with self._router_lock:
+                if self.subject_router is None:
+                    if self._router_failure is not None:
+                        failed_at, error = self._router_failure
+                        if time.monotonic() - failed_at < self.router_retry_seconds:
+                            raise RuntimeError(f"Subject router unavailable after a failed build: {error}")
+                    try:
+                        with span("router_build"):
+                            self.subject_router = SubjectRouter.build(
+                                lambda texts: self.embedding_cache.embed_many(texts, EMBEDDING_MODEL,
+                                                                              "retrieval_query"),
+                                self.subject_keywords,
+                                {subject: self.get_keyword_indexes(subject) for subject in self.subjects},
+                                min_confidence=self.router_min_confidence
+                            )
+                    except Exception as e:
+                        self._router_failure = (time.monotonic(), e)
+                        raise
+                    self._router_failure = None
+        return self.subject_router
+
+    async def aroute_subject(self, query: str, embedding=None) -> dict:
+        """Subject(s) to search for a query, from the router (or Gemini if routing is off).
+
+        embedding is an awaitable of the query embedding if one is already being computed.
+        Returns {"subject", "subjects", "confidence"}; if routing (or Gemini) fails every subject
+        is searched rather than guessing one, except for BUSY_ERRORS, which are raised.
+        """
+        if not self.use_router:
+            try:
+                subject = await self._in_thread(self._classify, query)
+            except BUSY_ERRORS:
+                raise
+            except Exception as e:
+                self._fallback("classify", e)
+                return {"subject": self.default_subject, "subjects": list(self.subjects), "confidence": None}
+            return {"subject": subject, "subjects": [subject], "confidence": None}
+        try:
+            router = await self._in_thread(self.get_subject_router)
+            vector = await embedding if embedding is not None else await self._in_thread(self._embed_query, query)
+            with span("route"):
+                routed = router.route(vector)
+        except BUSY_ERRORS:
+            raise
+        except Exception as e:
+            self._fallback("route", e)
+            return {"subject": self.default_subject, "subjects": list(self.subjects), "confidence": 0.0}
+        if len(routed["subjects"]) > 1:
+            count("low_confidence_routes")
+        return routed
+
+    async def aanalyze_query(self, query: str, embedding=None, route=True) -> dict:
+        """Return subject, filters and search text, plus the path that produced them.
+
+        path is "rules" (no LLM call), "rules+router" / "rules+llm" (rules gave the filters, the
+        embedding router or Gemini the subject) or "llm" (Gemini gave the filters). subjects lists
+        every subject to search: more than one when the router is not confident.
+        embedding is an awaitable of the query embedding, reused for routing. route=False lists
+        every subject when the rules cannot place the query, rather than embedding it to route
+        (keyword queries and exact references, which are answered without an embedding).
+        """
+        with span("rules"):
+            ruled = self._parse_rules(query)
+        routed = None
+        if ruled is not None:
+            path = "rules"
+            if ruled["subject"] is None and not route:
+                routed = {"subject": self.default_subject, "subjects": list(self.subjects), "confidence": None}
+            elif ruled["subject"] is None:
+                routed = await self.aroute_subject(query, embedding)
+                path = "rules+router" if self.use_router else "rules+llm"
+            parsed = {
+                "subject": ruled["subject"],
+                "filters": self._format_filters(ruled["filters"]),
+                "search_text": ruled["search_text"]
+            }
+        elif self.query_mode == "single":
+            parsed = await self._in_thread(self.understand_query, query)
+            if parsed["subject"] is None:
+                routed = await self.aroute_subject(query, embedding)
+            path = "llm"
+        else:
+            # Legacy mode: subject (router or classify_subject) and filters are independent,
+            # so run them side by side
+            routed, parsed = await asyncio.gather(
+                self.aroute_subject(query, embedding),
+                self._in_thread(self.parse_query, query)
+            )
+            path = "llm"
+
+        if routed is not None:
+            parsed["subject"] = routed["subject"]
+            parsed["subjects"] = routed["subjects"]
+            parsed["confidence"] = routed["confidence"]
+        else:
+            parsed["subjects"] = [parsed["subject"]]
+        parsed["path"] = path
+        with self._parse_paths_lock:
+            self.parse_paths[path] += 1
+        registry.inc("query_parses", path=path)
+        return parsed
+
+    def analyze_query(self, query: str) -> dict:
+        """Synchronous wrapper around aanalyze_query"""
+        return run_sync(self.aanalyze_query(query))
+
+    def llm_bypass_rate(self) -> float:
+        """Fraction of analyzed queries whose filters were parsed without Gemini"""
+        with self._parse_paths_lock:
+            total = sum(self.parse_paths.values())
+            bypassed = total - self.parse_paths["llm"]
+        return bypassed / total if total else 0.0
+
+    @staticmethod
+    def _threshold_matches(matches, relevance_threshold, max_results) -> list:
+        """De-duplicate by ID, drop matches below the threshold and cap the count in one pass"""
+        seen = set()
+        kept = []
+        for match in matches:
+            if match.score < relevance_threshold or match.id in seen:
+                continue
+            seen.add(match.id)
+            kept.append(match)
+            if len(kept) >= max_results:
+                break
+        return kept
+
+    async def asearch_questions(self, query: str, top_k=10, relevance_threshold=0.5, max_results=50,
+                                trace=None, hydrate=True) -> list:
+        """Search with query filters and semantic search, overlapping query analysis and embedding.
+
+        The embedding only needs the raw query text and the index is picked once the subject is
+        known, so latency is roughly that of the slowest single call. Fully specified question
+        references are fetched by ID instead (see lookup_reference). With keyword indexes,
+        short keyword queries are answered by BM25 alone and other queries fuse BM25 and
+        dense matches by reciprocal rank. Results of near-duplicate queries come from the
+        semantic cache. Pass a tracing.QueryTrace to collect per-stage timings and call counts.
+        Match scores are reciprocal rank fusion scores (see _fuse), or 1.0 for questions fetched
+        by reference; relevance_threshold applies to the cosine similarity of dense matches.
+        Matches from slim indexes are filled in from the document store unless hydrate=False
+        (then call hydrate() on just the results that are shown).
+        """
+        if trace is None and (registry.enabled or logger.isEnabledFor(logging.INFO)):
+            # Collected anyway for the per-search log line
+            trace = QueryTrace()
+        # Only this search records into trace; later searches in the same task get their own
+        token = current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            try:
+                with span("search"):
+                    results = await self._asearch(query, top_k, relevance_threshold, max_results)
+                    if hydrate:
+                        results = await self._in_thread(self.hydrate, results)
+            except Exception as e:
+                count("search_errors")
+                log_event("search_failed", level=logging.ERROR, query=query, error=str(e))
+                raise
+            count("searches")
+            count("search_results", len(results))
+            if trace is not None:
+                log_event("search", query=query, results=len(results),
+                          seconds=round(time.perf_counter() - start, 4), **trace.to_dict())
+            return results
+        finally:
+            current_trace.reset(token)
+
+    def _parse_rules(self, query: str):
+        if not self.use_rules:
+            return None
+        return parse_query_rules(query, self.subject_codes, self.subject_keywords)
+
+    async def _asearch(self, query, top_k, relevance_threshold, max_results) -> list:
+        ruled = self._parse_rules(query)
+        exact = ruled is not None and self.exact_lookup and reference_ids(ruled["filters"])
+        lexical = not exact and self._is_lexical(query, ruled)
+        if exact or lexical:
+            # Exact reference or keyword query spotted locally: no embedding needed unless
+            # the lookup comes back empty. References with an unconfigured subject code and
+            # keyword queries without a subject are not routed by embedding: the reference
+            # fixes the paper, and keyword queries search the keyword indexes of every subject.
+            parsed = await self.aanalyze_query(query, route=False)
+            search_embed = None
+        else:
+            embedding = asyncio.ensure_future(self._in_thread(self._embed_query, query))
+            parsed = await self.aanalyze_query(query, embedding)
+            search_embed = await embedding
         filters = parsed.get("filters", {})
-        
-        # Generate search embedding
-        search_embed = genai.embed_content(
-            model="models/text-embedding-004",
-            content=parsed.get("search_text", ""),
-            task_type="retrieval_query"
-        )["embedding"]
-        
+        subjects = parsed["subjects"]
+
+        if self.exact_lookup and reference_ids(filters):
+            # Each paper index is asked only for the IDs its own variants can have
+            code = filters["subjectCode"]["$eq"]
+            specs = self.registry.specs(self.subject_codes.get(code, parsed["subject"]))
+            found = await asyncio.gather(*(
+                self._in_thread(self._lookup_in, spec.name, reference_ids(filters, spec.variants))
+                for spec in specs
+            ))
+            matches = [match for paper_matches in found for match in paper_matches]
+            if matches:
+                return matches
+
+        keyword_text = parsed["search_text"] or query
+        limit = top_k if filters else max_results
+        if lexical:
+            keyword_indexes = [
+                keyword_index for subject in subjects for keyword_index in self.get_keyword_indexes(subject)
+            ]
+            if keyword_indexes:
+                matches = self._fuse(await asyncio.gather(*(
+                    self._in_thread(self._keyword_search, keyword_index, keyword_text, filters, limit)
+                    for keyword_index in keyword_indexes
+                )), limit)
+                if matches:
+                    count("lexical_only")
+                    return matches
+
+        if search_embed is None:
+            search_embed = await self._in_thread(self._embed_query, query)
+
+        scope = None
+        if self.semantic_cache is not None:
+            scope = SemanticQueryCache.scope(subjects, filters, top_k, relevance_threshold, max_results)
+            cached = self.semantic_cache.get(search_embed, scope)
+            if cached is not None:
+                return cached
+
+        # Subjects the router was unsure about are searched side by side; the ranked lists of
+        # every paper index are fused in one go
+        ranked_lists = await asyncio.gather(*(
+            self._search_subject(subject, search_embed, keyword_text, filters, top_k, relevance_threshold, max_results)
+            for subject in subjects
+        ))
+        matches = self._fuse([ranked for subject_lists in ranked_lists for ranked in subject_lists], limit)
+
+        if scope is not None:
+            self.semantic_cache.set(search_embed, scope, matches)
+        return matches
+
+    async def _search_subject(self, subject, search_embed, keyword_text, filters, top_k, relevance_threshold,
+                              max_results) -> list:
+        """Search every paper index of a subject side by side; returns all their ranked lists"""
+        paper_lists = await asyncio.gather(*(
+            self._search_paper(spec.name, search_embed, keyword_text, filters, top_k, relevance_threshold,
+                               max_results)
+            for spec in self.registry.specs(subject)
+        ))
+        return [ranked for lists in paper_lists for ranked in lists]
+
+    async def _search_paper(self, name, search_embed, keyword_text, filters, top_k, relevance_threshold,
+                            max_results) -> list:
+        """Ranked lists of one index: dense matches, plus keyword matches if it has a keyword index"""
+        index = await self._in_thread(self.registry.vector_index, name)
+        keyword_index = await self._in_thread(self.get_keyword_index, name)
+        if keyword_index is None:
+            return [await self._in_thread(
+                self._retrieve, index, search_embed, filters, top_k, relevance_threshold, max_results
+            )]
+
+        # Keyword matches cover exact terms, so fewer dense matches give the same recall
+        limit = top_k if filters else max_results
+        dense_matches, keyword_matches = await asyncio.gather(
+            self._in_thread(
+                self._retrieve, index, search_embed, filters, min(top_k, self.dense_top_k),
+                relevance_threshold, min(max_results, self.dense_top_k)
+            ),
+            self._in_thread(self._keyword_search, keyword_index, keyword_text, filters, limit)
+        )
+        return [dense_matches, keyword_matches]
+
+    def _lookup_in(self, name, ids) -> list:
+        if not ids:
+            return []
+        return self.lookup_reference(self.registry.vector_index(name), ids)
+
+    def lookup_reference(self, index, ids) -> list:
+        """Fetch questions by ID; returns matches with score 1.0 in the order of ids"""
+        with span("fetch"):
+            count("index_calls")
+            vectors = index.fetch(ids=ids).vectors
+        return [
+            Match(id=doc_id, score=1.0, metadata=dict(vectors[doc_id].metadata or {}))
+            for doc_id in ids
+            if doc_id in vectors
+        ]
+
+    def search_questions(self, query: str, top_k=10, relevance_threshold=0.5, max_results=50, trace=None,
+                         hydrate=True) -> list:
+        """Search Pinecone with query filters and semantic search (synchronous wrapper around asearch_questions)"""
+        return run_sync(self.asearch_questions(query, top_k, relevance_threshold, max_results, trace, hydrate))
+
+    def hydrate(self, matches) -> list:
+        """Add the full question from the document store to matches that only carry slim metadata,
+        in one bulk read"""
+        ids = [match.id for match in matches if "questionStatement" not in (match.metadata or {})]
+        if not ids:
+            return matches
+        with span("hydrate"):
+            documents = (self.document_store or get_document_store()).get_many(ids)
+        count("hydrated", len(documents))
+        return [
+            Match(id=match.id, score=match.score, metadata={**documents[match.id], **(match.metadata or {})})
+            if match.id in documents else match
+            for match in matches
+        ]
+
+    def _retrieve(self, index, search_embed, filters, top_k, relevance_threshold, max_results) -> list:
+        """Query the chosen index with the search embedding"""
         # If filters are present, use simple top_k approach
         if filters:
-            return index.query(
+            return self._query_index(
+                index,
                 vector=search_embed,
                 filter=filters,
                 top_k=top_k,
@@ -143,7 +723,21 @@ class QueryProcessor:
                 alpha=0.5
             )["matches"]
         
-        # If no filters, use batch approach with relevance threshold
+        # If no filters, keep everything above the relevance threshold
+        if self.retrieval_mode == "single":
+            # One bounded query: matches come back sorted by score, so the top max_results
+            # are all we could ever return
+            results = self._query_index(
+                index,
+                vector=search_embed,
+                top_k=max_results,
+                include_metadata=True,
+                hybrid=True,
+                alpha=0.5
+            )["matches"]
+            return self._threshold_matches(results, relevance_threshold, max_results)
+
+        # Legacy doubling loop, kept for comparison
         else:
             # Start with a reasonable batch size
             batch_size = 5
@@ -152,7 +746,8 @@ class QueryProcessor:
             
             while last_score >= relevance_threshold:
                 # Query Pinecone with current batch
-                results = index.query(
+                results = self._query_index(
+                    index,
                     vector=search_embed,
                     filter=filters,  # No filters
                     top_k=batch_size,
@@ -177,9 +772,8 @@ class QueryProcessor:
                 # Increase batch size for next iteration
                 batch_size *= 2
             
-            # Filter out results below threshold and limit to top_k
-            filtered_matches = [match for match in all_matches if match.score >= relevance_threshold]
-            return filtered_matches[:50]
+            # Each round repeats the previous rounds' matches, so de-duplicate while filtering
+            return self._threshold_matches(all_matches, relevance_threshold, max_results)
 
 # quer_proc=QueryProcessor()
 # result=quer_proc.parse_query("give me question from year 2023")
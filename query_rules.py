@@ -0,0 +1,198 @@
+import re
+
+# O-Level syllabus codes we index, used to infer the subject without asking Gemini
+SUBJECT_CODES = {
+    "5054": "physics",
+    "5070": "chemistry",
+}
+
+# Exam sessions and paper variants as they appear in question IDs
+# ({subjectCode}_{variant}_{session} {year}_q{n}, see connections.py)
+EXAM_SESSIONS = ["February/March", "May/June", "October/November"]
+PAPER_VARIANTS = ["11", "12", "13"]
+
+
+def paper_variants(paper=None) -> list:
+    """Variants of a paper in question IDs: "Paper 2" -> 21, 22, 23 (PAPER_VARIANTS if unnumbered)"""
+    number = re.search(r"\d+", str(paper or ""))
+    if number is None:
+        return list(PAPER_VARIANTS)
+    return [f"{int(number.group())}{variant[-1]}" for variant in PAPER_VARIANTS]
+
+SUBJECT_KEYWORDS = {
+    "physics": {
+        "physics", "magnetism", "magnetic", "electricity", "circuit", "circuits", "current",
+        "voltage", "resistance", "resistor", "ammeter", "voltmeter", "force", "forces",
+        "friction", "pressure", "moment", "moments", "velocity", "acceleration", "momentum",
+        "lens", "lenses", "mirror", "optics", "refraction", "reflection", "wave", "waves",
+        "sound", "radioactivity", "half-life", "nuclear", "transformer", "thermal", "kinematics",
+        "vectors", "scalars", "density",
+    },
+    "chemistry": {
+        "chemistry", "chemical", "reaction", "reactions", "acid", "acids", "base", "bases",
+        "salt", "salts", "element", "elements", "compound", "compounds", "bonding", "ionic",
+        "covalent", "mole", "moles", "electrolysis", "organic", "alkane", "alkanes", "alkene",
+        "alkenes", "polymer", "polymers", "periodic", "oxidation", "redox", "titration",
+        "atomic", "isotope", "isotopes", "metal", "metals", "ammonia", "catalyst",
+    },
+}
+
+MONTHS = {
+    "january": "January", "jan": "January",
+    "february": "February", "feb": "February",
+    "march": "March", "mar": "March",
+    "april": "April", "apr": "April",
+    "may": "May",
+    "june": "June", "jun": "June",
+    "july": "July", "jul": "July",
+    "august": "August", "aug": "August",
+    "september": "September", "sep": "September", "sept": "September",
+    "october": "October", "oct": "October",
+    "november": "November", "nov": "November",
+    "december": "December", "dec": "December",
+}
+
+# Words that need interpretation (relative dates, ordinals) - leave those queries to Gemini
+AMBIGUOUS_WORDS = {
+    "recent", "latest", "last", "previous", "past", "this", "next", "newest", "oldest",
+    "first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth", "tenth",
+    "between", "before", "after", "since", "until",
+}
+# Words that are only relative dates before these words ("current year"); "current" alone is physics
+AMBIGUOUS_BEFORE = {
+    "current": {"year", "years", "paper", "papers", "session", "exam", "exams"},
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:-[a-z]+)*|\d+|'\d{2}\b|/")
+
+QUESTION_WORDS = {"question", "questions", "q", "qn", "qs", "ques"}
+QUESTION_NUMBER_WORDS = {"no", "number", "num"}
+VARIANT_WORDS = {"variant", "var", "v", "version"}
+
+
+def _is_year(token: str) -> bool:
+    return len(token) == 4 and token.isdigit() and 1990 <= int(token) <= 2099
+
+
+def _short_year(token: str) -> str:
+    return "20" + token.lstrip("'")
+
+
+def parse_query_rules(query: str, subject_codes=None, subject_keywords=None) -> dict | None:
+    """Extract filters with local rules, mirroring the rules in QueryProcessor.parse_query.
+
+    Returns a dict with "filters" (raw values, not yet Pinecone formatted), "search_text"
+    and "subject" (None when no subject code or keyword gives it away), or None when the
+    query contains something the rules cannot fully account for. subject_codes and
+    subject_keywords default to SUBJECT_CODES and SUBJECT_KEYWORDS.
+    """
+    subject_codes = SUBJECT_CODES if subject_codes is None else subject_codes
+    subject_keywords = SUBJECT_KEYWORDS if subject_keywords is None else subject_keywords
+    # Split glued forms like "q5", "v12" and "5054/12" before tokenizing
+    text = re.sub(r"\b(q|qn|v|var)(\d{1,2})\b", r"\1 \2", query.lower())
+    tokens = TOKEN_PATTERN.findall(text)
+    filters = {}
+    consumed = set()
+
+    def put(field, value, *positions):
+        # Conflicting values for the same field are ambiguous
+        if filters.get(field, value) != value:
+            raise ValueError(field)
+        filters[field] = value
+        consumed.update(positions)
+
+    try:
+        for i, token in enumerate(tokens):
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+            if token in AMBIGUOUS_WORDS or nxt in AMBIGUOUS_BEFORE.get(token, ()):
+                return None
+            prev = tokens[i - 1] if i > 0 else None
+
+            if token in QUESTION_WORDS and nxt is not None:
+                j = i + 1
+                if tokens[j] in QUESTION_NUMBER_WORDS and j + 1 < len(tokens):
+                    j += 1
+                if tokens[j].isdigit() and len(tokens[j]) <= 2:
+                    put("questionNumber", str(int(tokens[j])), i, j)
+            elif token in VARIANT_WORDS and nxt is not None and nxt.isdigit() and len(nxt) <= 2:
+                put("variant", nxt, i, i + 1)
+            elif token.isdigit() and len(token) == 4 and i not in consumed:
+                # Configured codes win: 2058 or 2210 would otherwise read as years
+                if token not in subject_codes and _is_year(token):
+                    put("year", token, i)
+                else:
+                    put("subjectCode", token, i)
+                    # "5054/12" is code/variant
+                    if nxt == "/" and i + 2 < len(tokens) and tokens[i + 2].isdigit() and len(tokens[i + 2]) == 2:
+                        put("variant", tokens[i + 2], i + 1, i + 2)
+            elif token in MONTHS:
+                year_next = nxt is not None and (_is_year(nxt) or (len(nxt) == 2 and nxt.isdigit()) or nxt.startswith("'"))
+                year_prev = prev is not None and _is_year(prev)
+                # "may" is only a month when a year or another month sits right next to it
+                if token == "may" and not (year_next or year_prev or nxt == "/"):
+                    continue
+                # Several months ("May/June") - take only the first one
+                if "months" not in filters:
+                    put("months", MONTHS[token], i)
+                consumed.add(i)
+                if year_next and not _is_year(nxt):
+                    put("year", _short_year(nxt), i + 1)
+            elif token.startswith("'"):
+                put("year", _short_year(token), i)
+            elif token == "/" and prev in MONTHS and nxt in MONTHS:
+                consumed.add(i)
+    except ValueError:
+        return None
+
+    # Any number we could not place (e.g. "paper 2" aside) means the rules missed something
+    for i, token in enumerate(tokens):
+        if i in consumed:
+            continue
+        if token.isdigit() and not (i > 0 and tokens[i - 1] == "paper"):
+            return None
+        if token == "/":
+            return None
+
+    subject = subject_codes.get(filters.get("subjectCode"))
+    if subject is None:
+        words = set(tokens)
+        matched = [name for name, keywords in subject_keywords.items() if words & keywords]
+        if len(matched) == 1:
+            subject = matched[0]
+
+    return {"filters": filters, "search_text": query, "subject": subject}
+
+
+def _filter_value(condition):
+    """Plain value of a filter, whether raw or Pinecone formatted ({"$eq": value})"""
+    if isinstance(condition, dict):
+        return condition.get("$eq")
+    return condition
+
+
+def reference_ids(filters: dict, variants=None) -> list | None:
+    """Question IDs a fully specified reference can point to, or None if it is not one.
+
+    subjectCode, year and questionNumber are required; a missing variant or month expands to
+    every exam session or every one of `variants` (the variants of the paper index searched,
+    default PAPER_VARIANTS). A variant outside `variants` gives no IDs.
+    """
+    values = {name: _filter_value(condition) for name, condition in filters.items()}
+    if not all(values.get(name) for name in ["subjectCode", "year", "questionNumber"]):
+        return None
+    try:
+        question_number = str(int(values["questionNumber"]))
+    except (TypeError, ValueError):
+        return None
+
+    if values.get("variant"):
+        variants = [str(values["variant"])] if variants is None or str(values["variant"]) in variants else []
+    elif variants is None:
+        variants = PAPER_VARIANTS
+    month = values.get("months")
+    sessions = [session for session in EXAM_SESSIONS if not month or month in session.split("/")]
+    return [
+        f"{values['subjectCode']}_{variant}_{session} {values['year']}_q{question_number}"
+        for variant in variants
+        for session in sessions
+    ]
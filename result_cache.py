@@ -0,0 +1,64 @@
+import time
+import threading
+from collections import OrderedDict
+from tracing import count
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: lowercased with whitespace collapsed"""
+    return " ".join(query.split()).lower()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after they were stored.
+
+    name labels its hits and misses in the exported metrics.
+    """
+
+    def __init__(self, maxsize=256, ttl=600, name="result"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    count("cache_hits", cache=self.name)
+                    return value
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            count("cache_misses", cache=self.name)
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,288 @@
+"""Headless JSON HTTP service for search and question generation.
+
+    POST /search    {"query": "...", "page": 1, "page_size": 10, "fields": ["year", "questionStatement"]}
+    POST /generate  {"query": "...", "timeout": 20}
+    GET  /health, GET /metrics
+
+The query processor, Gemini model and index connections are created once and shared by every
+request. Requests are served concurrently, with the work itself done by a pool of
+SERVICE_WORKERS threads (default: one per core); a request still running after its timeout
+(SERVICE_TIMEOUT, or "timeout" in the body up to that) gets a 504. Search results are kept for
+SEARCH_CACHE_TTL seconds, so fetching the next page does not search again.
+
+Each result's "score" ranks it within its response: a reciprocal rank fusion score over the
+dense and keyword matches of every index searched (1.0 for questions fetched by reference),
+not a similarity.
+
+Usage:
+    python search_service.py --port 8080
+    python search_service.py --port 8080 --fake 2000   # offline stand-ins with 2000 synthetic questions
+"""
+import os
+import json
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from gemini_client import BUSY_ERRORS, ScheduledModel
+from generation import create_generation_prompt
+from metrics import log_event, registry, start_exporter
+from result_cache import TTLCache, normalize_query
+from tracing import count, count_llm_usage, span
+
+MAX_PAGE_SIZE = 50
+MAX_BODY_BYTES = 64 * 1024
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class SearchService:
+    """Search and generation on top of one shared QueryProcessor, independent of HTTP"""
+
+    def __init__(self, query_processor, model, workers=None, timeout=None):
+        self.query_processor = query_processor
+        self.model = model
+        self.workers = workers or int(os.getenv("SERVICE_WORKERS", "0")) or os.cpu_count() or 4
+        self.timeout = timeout or float(os.getenv("SERVICE_TIMEOUT", "30"))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="search-service")
+        self._results = TTLCache(
+            maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "600")),
+            name="service_result"
+        )
+
+    def _run(self, fn, *args, timeout=None):
+        """Run fn in the worker pool and wait at most timeout seconds (capped at the service's)"""
+        timeout = min(timeout, self.timeout) if timeout else self.timeout
+        future = self._executor.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # The worker finishes in the background; a cached search still helps the retry
+            future.cancel()
+            raise ServiceError(504, f"Request timed out after {timeout:g}s")
+        except BUSY_ERRORS as e:
+            raise ServiceError(503, f"Gemini is busy, try again shortly ({e.__class__.__name__}: {e})")
+
+    @staticmethod
+    def _request(body: dict) -> tuple:
+        """Validate the fields shared by every endpoint: (query, search params, timeout)"""
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise ServiceError(400, "Field 'query' must be a non-empty string")
+        try:
+            params = (
+                int(body.get("top_k", 10)),
+                float(body.get("relevance_threshold", 0.5)),
+                int(body.get("max_results", 50)),
+            )
+            timeout = float(body["timeout"]) if body.get("timeout") is not None else None
+        except (TypeError, ValueError):
+            raise ServiceError(400, "Fields 'top_k', 'relevance_threshold', 'max_results' and 'timeout' must be numbers")
+        return query, params, timeout
+
+    def _matches(self, query: str, params: tuple) -> list:
+        key = (normalize_query(query),) + params
+        matches = self._results.get(key)
+        if matches is None:
+            # Only the requested page is read from the document store (slim indexes)
+            matches = self.query_processor.search_questions(query, *params, hydrate=False)
+            self._results.set(key, matches)
+        return matches
+
+    def _page(self, query: str, params: tuple, start: int, size: int) -> tuple:
+        matches = self._matches(query, params)
+        return len(matches), self.query_processor.hydrate(matches[start:start + size])
+
+    @staticmethod
+    def _select(metadata: dict, fields) -> dict:
+        if fields is None:
+            return dict(metadata)
+        return {field: metadata[field] for field in fields if field in metadata}
+
+    def search(self, body: dict) -> dict:
+        """One page of results, with only the requested metadata fields"""
+        query, params, timeout = self._request(body)
+        try:
+            page = max(1, int(body.get("page", 1)))
+            page_size = min(MAX_PAGE_SIZE, max(1, int(body.get("page_size", 10))))
+        except (TypeError, ValueError):
+            raise ServiceError(400, "Fields 'page' and 'page_size' must be integers")
+        fields = body.get("fields")
+        if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+            raise ServiceError(400, "Field 'fields' must be a list of metadata field names")
+
+        start = (page - 1) * page_size
+        total, matches = self._run(self._page, query, params, start, page_size, timeout=timeout)
+        return {
+            "query": query,
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "has_more": start + page_size < total,
+            "results": [
+                {"id": match.id, "score": match.score, "metadata": self._select(match.metadata, fields)}
+                for match in matches
+            ],
+        }
+
+    def _generate(self, query: str, params: tuple) -> dict:
+        matches = self.query_processor.hydrate(self._matches(query, params)[:10])
+        if not matches:
+            return {"query": query, "text": "", "source_ids": []}
+        with span("generate"):
+            count("llm_calls", stage="generate")
+            response = self.model.generate_content(create_generation_prompt(matches))
+        count_llm_usage(response)
+        return {"query": query, "text": response.text, "source_ids": [match.id for match in matches[:10]]}
+
+    def generate(self, body: dict) -> dict:
+        """New questions in the style of the query's top search results"""
+        query, params, timeout = self._request(body)
+        return self._run(self._generate, query, params, timeout=timeout)
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "timeout": self.timeout,
+            "subjects": self.query_processor.subjects,
+            "opened_indexes": self.query_processor.registry.opened(),
+        }
+
+
+def make_handler(service: SearchService):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: bytes, content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status: int, payload: dict):
+            self._send(status, json.dumps(payload, default=str).encode("utf-8"))
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                raise ServiceError(413, "Request body too large")
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                raise ServiceError(400, "Request body must be JSON")
+            if not isinstance(body, dict):
+                raise ServiceError(400, "Request body must be a JSON object")
+            return body
+
+        def _handle(self, endpoint: str, action):
+            try:
+                status, payload = 200, action()
+            except ServiceError as e:
+                status, payload = e.status, {"error": str(e)}
+            except Exception as e:
+                log_event("service_error", level=logging.ERROR, endpoint=endpoint,
+                          error=f"{e.__class__.__name__}: {e}")
+                status, payload = 500, {"error": "Internal error"}
+            count("http_requests", endpoint=endpoint, status=status)
+            self._send_json(status, payload)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/health":
+                self._handle("health", service.health)
+            elif path == "/metrics":
+                self._send(200, registry.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            path = self.path.split("?")[0]
+            if path == "/search":
+                self._handle("search", lambda: service.search(self._body()))
+            elif path == "/generate":
+                self._handle("generate", lambda: service.generate(self._body()))
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def fake_services(n_questions=2000, latency_ms=0.0, rpm=0):
+    """QueryProcessor and model on the offline stand-ins (fakes.py), with synthetic questions indexed.
+
+    The stand-ins are limited to rpm calls per minute per model (0 = unlimited).
+    """
+    from benchmark import synthetic_papers
+    from embedding_cache import EmbeddingCache
+    from fakes import FakeIndex, HashEmbedder, ScriptedModel
+    from gemini_client import GeminiScheduler
+    from keyword_index import KeywordIndex
+    from paper_loader import build_question_record
+    from query_processor import QueryProcessor
+
+    embedder = HashEmbedder(latency_ms=latency_ms)
+    index = FakeIndex(latency_ms=latency_ms)
+    keyword_index = KeywordIndex()
+    scheduler = GeminiScheduler(rpm=rpm, embed_rpm=rpm)
+    cache = EmbeddingCache(path=None, embed_fn=embedder, scheduler=scheduler)
+    for paper in synthetic_papers(n_questions):
+        records = [build_question_record(paper, q) for q in paper["questions"]]
+        vectors = cache.embed_many([content for _, content, _ in records], "models/text-embedding-004",
+                                   "retrieval_document")
+        index.upsert([(unique_id, vector, metadata) for (unique_id, _, metadata), vector in zip(records, vectors)])
+        keyword_index.upsert([(unique_id, metadata) for unique_id, _, metadata in records])
+
+    model = ScheduledModel(ScriptedModel(latency_ms=latency_ms), scheduler)
+    # Both subjects share one index here; they are told apart by subjectCode
+    query_processor = QueryProcessor(index, index, embedding_cache=cache, model=model,
+                                     keyword_indexes={"physics": keyword_index, "chemistry": keyword_index},
+                                     scheduler=scheduler)
+    return query_processor, model
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="JSON HTTP service for past-paper search and generation")
+    parser.add_argument("--host", default=os.getenv("SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT", "8080")))
+    parser.add_argument("--workers", type=int, help="worker threads (default SERVICE_WORKERS or one per core)")
+    parser.add_argument("--timeout", type=float, help="request timeout in seconds (default SERVICE_TIMEOUT or 30)")
+    parser.add_argument("--fake", type=int, metavar="N", help="serve N synthetic questions from offline stand-ins")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency of the stand-ins")
+    args = parser.parse_args()
+
+    start_exporter()
+    # /metrics is served here as well, so always collect
+    registry.enabled = True
+    if args.fake:
+        query_processor, model = fake_services(args.fake, args.latency_ms)
+    else:
+        import google.generativeai as genai
+        from query_processor import QueryProcessor
+        query_processor = QueryProcessor()
+        model = ScheduledModel(genai.GenerativeModel('gemini-1.5-flash'))
+    service = SearchService(query_processor, model, workers=args.workers, timeout=args.timeout)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    log_event("service_started", host=args.host, port=server.server_address[1], workers=service.workers)
+    print(f"Serving on http://{args.host}:{server.server_address[1]} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import json
+import time
+import threading
+import numpy as np
+from tracing import count
+
+
+class SemanticQueryCache:
+    """Search results keyed by query embedding, for differently phrased versions of one request.
+
+    A lookup hits when a cached query with the same scope (subject, filters and search
+    parameters) has an embedding within max_distance cosine distance of the new one. Vectors
+    and scope IDs are kept in preallocated arrays, so a lookup is a vectorized scope/age mask
+    and one matrix-vector product over the matching rows;
+    the least recently used entry is evicted once max_entries is reached, and entries
+    expire ttl seconds after they were stored.
+    """
+
+    def __init__(self, max_entries=1024, max_distance=0.07, ttl=600, dimension=768):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self._vectors = np.zeros((max_entries, dimension), dtype=np.float32)
+        self._scope_ids = np.full(max_entries, -1, dtype=np.int64)
+        self._scope_index = {}  # scope -> ID in _scope_ids
+        self._next_scope_id = 0
+        self._results = [None] * max_entries
+        self._stored_at = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope(subject, filters, *params) -> str:
+        """Key of what must match exactly for cached results to be reused"""
+        return json.dumps([subject, filters, *params], sort_keys=True, default=str)
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def _scope_id(self, scope: str) -> int:
+        scope_id = self._scope_index.get(scope)
+        if scope_id is None:
+            if len(self._scope_index) >= 4 * self.max_entries:
+                # Forget scopes no row uses any more, keeping the IDs of live ones
+                live = set(self._scope_ids[:self._size].tolist())
+                self._scope_index = {key: value for key, value in self._scope_index.items() if value in live}
+            scope_id = self._scope_index[scope] = self._next_scope_id
+            self._next_scope_id += 1
+        return scope_id
+
+    def get(self, vector, scope: str):
+        """Return the results of the closest cached query in scope, or None"""
+        query = self._normalize(vector)
+        with self._lock:
+            scope_id = self._scope_index.get(scope)
+            rows = np.empty(0, dtype=np.int64)
+            if scope_id is not None:
+                fresh = time.monotonic() - self._stored_at[:self._size] <= self.ttl
+                rows = np.flatnonzero((self._scope_ids[:self._size] == scope_id) & fresh)
+            if rows.size:
+                similarities = self._vectors[rows] @ query
+                best = int(np.argmax(similarities))
+                if 1.0 - float(similarities[best]) <= self.max_distance:
+                    row = int(rows[best])
+                    self._last_used[row] = self._tick()
+                    self.hits += 1
+                    count("cache_hits", cache="semantic")
+                    return self._results[row]
+            self.misses += 1
+            count("cache_misses", cache="semantic")
+            return None
+
+    def set(self, vector, scope: str, results):
+        with self._lock:
+            if self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used[:self._size]))
+            self._vectors[row] = self._normalize(vector)
+            self._scope_ids[row] = self._scope_id(scope)
+            self._results[row] = results
+            self._stored_at[row] = time.monotonic()
+            self._last_used[row] = self._tick()
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._scope_ids[:] = -1
+            self._scope_index = {}
+            self._results = [None] * self.max_entries
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
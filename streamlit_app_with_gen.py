@@ -1,11 +1,15 @@
 import os
-import requests
+import logging
 import streamlit as st
 from dotenv import load_dotenv
-from pinecone import Pinecone
 from query_processor import QueryProcessor
-from PIL import Image
-from io import BytesIO
+from image_cache import ImageFetchError, get_image_cache, is_drive_url
+from embedding_cache import get_default_cache
+from gemini_client import BUSY_ERRORS, ScheduledModel
+from generation import create_generation_prompt
+from result_cache import TTLCache, normalize_query
+from metrics import log_event, start_exporter
+from tracing import count, count_llm_usage, span
 import google.generativeai as genai
 
 # Configuration functions
@@ -18,59 +22,94 @@ def configure_gemini():
         raise ValueError("GOOGLE_API_KEY not found in environment variables")
         
     genai.configure(api_key=google_api_key)
-    return genai.GenerativeModel('gemini-1.5-flash')
-
-def initialize_pinecone():
-    """Initialize and return Pinecone index connections"""
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    return {
-        "physics": pc.Index("o-level-physics-paper-1"),
-        "chemistry": pc.Index("o-level-chemistry-paper-1")
-    }
+    # Shares rate limits and retries with the query processor's calls
+    return ScheduledModel(genai.GenerativeModel('gemini-1.5-flash'))
+
+@st.cache_resource
+def get_services():
+    """Create the query processor and the Gemini model once per process (indexes from indexes.json
+    connect on first use)"""
+    # Metrics endpoint/file and JSON logs, if configured (METRICS_PORT, METRICS_FILE, LOG_FORMAT)
+    start_exporter()
+    query_processor = QueryProcessor()
+    return query_processor, configure_gemini()
+
+@st.cache_resource
+def get_result_cache():
+    """Search results and generated questions, shared across sessions for SEARCH_CACHE_TTL seconds"""
+    return TTLCache(
+        maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "256")),
+        ttl=float(os.getenv("SEARCH_CACHE_TTL", "600"))
+    )
 
 # Helper functions
 def display_image(image_url):
     """Handle image display for both regular URLs and Google Drive links"""
     try:
-        if 'drive.google.com' in image_url:
-            file_id = image_url.split('/d/')[1].split('/')[0]
-            direct_url = f'https://drive.google.com/uc?export=download&id={file_id}'
-            session = requests.Session()
-            response = session.get(direct_url, stream=True)
-            
-            if response.status_code == 200:
-                image = Image.open(BytesIO(response.content))
-                image = image.resize((1000, 500))
-                st.image(image, caption="Question Diagram", use_container_width=True)
-            else:
-                st.error(f"Failed to load Google Drive image (HTTP {response.status_code})")
+        if is_drive_url(image_url):
+            # Downloaded, resized and cached on disk once (usually prefetched for the whole page)
+            image = get_image_cache().get(image_url)
+            st.image(image, caption="Question Diagram", use_container_width=True)
         else:
             st.image(image_url, caption="Question Diagram", use_container_width=True)
-            
+
+    except ImageFetchError as e:
+        st.error(str(e))
     except Exception as e:
         st.error(f"Error displaying image: {str(e)}")
 
-def create_generation_prompt(results):
-    """Create prompt for question generation based on search results"""
-    examples = []
-    for match in results[:10]:
+def result_image_urls(results):
+    """Collect the image URLs display_image will be called with for these results"""
+    urls = []
+    for match in results:
         meta = match.metadata
-        example = f"Question: {meta['questionStatement']}\n"
-        if meta.get('options') and 'https' not in meta.get('options')[0]:
-            example += "Options:\n" + "\n".join(meta['options']) + "\n"
-        examples.append(example)
-    
-    return f"""You are an expert O level examiner. Create new exam questions similar to these examples:
+        if meta.get('image'):
+            if isinstance(meta['image'],str) and meta['image'] not in ['', 'urlOfImage']:
+                urls.append(meta['image'])
+            if isinstance(meta['options'], list):
+                urls.extend(img for img in meta['image'] if "https" in img)
+        if meta.get('options') and isinstance(meta['options'], list):
+            urls.extend(opt for opt in meta['options'] if "https" in opt)
+    return urls
+
+def render_generated_line(line):
+    """Render one generated line, making question lines (starting with a number) bold"""
+    # Skip empty lines
+    if not line.strip():
+        return
+
+    # If the line starts with a number (question), make it bold
+    if line.strip()[0].isdigit():
+        st.divider()
+        st.markdown(f"**{line}**")
+    else:
+        st.markdown(line)
+
+def stream_generated_questions(response):
+    """Render a streamed Gemini response line by line as it arrives and return the full text"""
+    text = ""
+    pending = ""
+    partial = st.empty()
+    for chunk in response:
+        text += chunk.text
+        pending += chunk.text
+        st.session_state["generated_text"] = text
 
-{'\n\n'.join(examples)}
+        # Render every completed line; the unfinished one is previewed below them
+        *lines, pending = pending.split('\n')
+        if lines:
+            partial.empty()
+            for line in lines:
+                render_generated_line(line)
+            partial = st.empty()
+        partial.markdown(pending)
 
-Guidelines:
-1. generate 10 questions
-2. Follow O-Level standards
-3. No images or links
-4. Include multiple-choice options when applicable
-6. Make questions original but similar in style to examples
-7. Keep questions clear and self-contained"""
+    partial.empty()
+    render_generated_line(pending)
+    return text
+
+def stop_generation():
+    st.session_state["generation_stopped"] = True
 
 # Streamlit app configuration
 st.set_page_config(
@@ -97,14 +136,10 @@ st.markdown("""
 # App header
 st.markdown("<h1 class='header'>📚 WISSEN</h1>", unsafe_allow_html=True)
 
-# Initialize services
+# Initialize services (once per process, shared by every session and rerun)
 try:
-    indices = initialize_pinecone()
-    query_processor = QueryProcessor(
-        physics_index=indices["physics"],
-        chemistry_index=indices["chemistry"]
-    )
-    gemini_model = configure_gemini()
+    query_processor, gemini_model = get_services()
+    result_cache = get_result_cache()
 except Exception as e:
     st.error(f"Failed to initialize services: {str(e)}")
     st.stop()
@@ -132,6 +167,20 @@ with st.sidebar:
     st.markdown("- 'Mirror diagram questions'")
     st.markdown("- 'Chemical reactions questions'")
     st.markdown("- 'Atomic structure problems'")
+    st.markdown("---")
+    with st.expander("Cache statistics"):
+        st.markdown("**Search results**")
+        st.json(result_cache.stats())
+        if query_processor.semantic_cache is not None:
+            st.markdown("**Similar queries**")
+            st.json(query_processor.semantic_cache.stats())
+        st.markdown("**Query embeddings**")
+        st.json(get_default_cache().stats())
+        st.markdown("**Query embedding batches**")
+        st.json(query_processor.embedding_batcher.stats())
+        st.markdown("**Images**")
+        st.json(get_image_cache().stats())
+        st.markdown(f"**LLM bypass rate:** {query_processor.llm_bypass_rate():.0%}")
 
 # Search form
 with st.form("search_form"):
@@ -141,45 +190,66 @@ with st.form("search_form"):
 
 # Handle search
 if search_button and query:
-    with st.spinner("Searching ..."):
-        try:
-            results = query_processor.search_questions(query)
-        except Exception as e:
-            st.error(f"Search failed: {str(e)}")
-            st.stop()
+    cache_key = normalize_query(query)
+    # Both modes start from the same search, so switching modes reuses it
+    results = result_cache.get(("search", cache_key))
+    if results is None:
+        with st.spinner("Searching ..."):
+            try:
+                results = query_processor.search_questions(query)
+            except BUSY_ERRORS:
+                st.warning("Search is busy right now. Please try again in a few seconds.")
+                st.stop()
+            except Exception as e:
+                st.error(f"Search failed: {str(e)}")
+                st.stop()
+        result_cache.set(("search", cache_key), results)
     
     if not results:
         st.warning("No matching questions found. Try different keywords.")
     else:
         if "Generation" in app_mode:
             try:
-                with st.spinner("Generating new questions using AI..."):
-                    prompt = create_generation_prompt(results)
-                    response = gemini_model.generate_content(prompt)
-                    
-                    if response.text:
+                generated = result_cache.get(("generation", cache_key))
+                if generated is not None:
+                    st.markdown("## 🚀 Generated Questions")
+                    for line in generated.split('\n'):
+                        render_generated_line(line)
+                else:
+                    with span("generate"):
+                        with st.spinner("Generating new questions using AI..."):
+                            prompt = create_generation_prompt(results)
+                            count("llm_calls", stage="generate")
+                            response = gemini_model.generate_content(prompt, stream=True)
+
                         st.markdown("## 🚀 Generated Questions")
-                        
-                        # Split the response into lines
-                        lines = response.text.split('\n')
-                        
-                        for line in lines:
-                            # Skip empty lines
-                            if not line.strip():
-                                continue
-                                
-                            # If the line starts with a number (question), make it bold
-                            if line.strip() and line.strip()[0].isdigit():
-                                st.divider()
-                                st.markdown(f"**{line}**")
-                            else:
-                                st.markdown(line)
+                        st.session_state["generated_text"] = ""
+                        # Clicking stop reruns the script, which interrupts the stream below
+                        stop_slot = st.empty()
+                        stop_slot.button("⏹ Stop generating", on_click=stop_generation)
+                        text = stream_generated_questions(response)
+                        stop_slot.empty()
+                    count_llm_usage(response)
+
+                    if text.strip():
+                        # Only complete generations are cached; a stopped one never gets here
+                        result_cache.set(("generation", cache_key), text)
                     else:
                         st.error("Failed to generate questions. Please try again.")
+            except BUSY_ERRORS as e:
+                count("generation_errors")
+                log_event("generation_throttled", level=logging.WARNING, query=query, error=str(e))
+                st.warning("Question generation is busy right now. Please try again in a few seconds.")
             except Exception as e:
+                count("generation_errors")
+                log_event("generation_failed", level=logging.ERROR, query=query, error=str(e))
                 st.error(f"Generation failed: {str(e)}")
         else:
             st.markdown(f"### Found {len(results)} results for: '{query}'")
+
+            # Fetch every Drive diagram on the page in parallel before rendering
+            with st.spinner("Loading diagrams..."):
+                get_image_cache().prefetch(url for url in result_image_urls(results) if is_drive_url(url))
             
             for i, match in enumerate(results, 1):
                 meta = match.metadata
@@ -215,4 +285,11 @@ if search_button and query:
                                     st.markdown(f"- {opt}")
 
 elif search_button and not query:
-    st.error("Please enter a search query first!")
\ No newline at end of file
+    st.error("Please enter a search query first!")
+
+# Generation was stopped early: keep showing what had arrived
+elif st.session_state.pop("generation_stopped", False) and st.session_state.get("generated_text"):
+    st.markdown("## 🚀 Generated Questions")
+    st.info("Generation stopped.")
+    for line in st.session_state["generated_text"].split('\n'):
+        render_generated_line(line)
\ No newline at end of file
@@ -0,0 +1,75 @@
+from collections import Counter
+import numpy as np
+
+# Per-subject topics (from the keyword indexes) used as routing examples
+MAX_TOPICS_PER_SUBJECT = 200
+
+
+class SubjectRouter:
+    """Route a query embedding to a subject by its nearest example embeddings.
+
+    Each subject has a small set of example texts (its name, syllabus keywords and the topics of
+    its indexed questions). A subject's score is the mean cosine similarity of the query to its
+    `neighbours` closest examples; confidence is the margin between the two best subjects.
+    Below min_confidence the query should be searched in every subject.
+    """
+
+    def __init__(self, examples: dict, min_confidence=0.03, neighbours=3):
+        self.min_confidence = min_confidence
+        self.neighbours = neighbours
+        self._examples = {}
+        for subject, vectors in examples.items():
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._examples[subject] = matrix / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def example_texts(subject_keywords: dict, keyword_indexes=None) -> dict:
+        """Name and keywords of each subject plus the most common topics of its keyword indexes"""
+        keyword_indexes = keyword_indexes or {}
+        texts = {}
+        for subject, keywords in subject_keywords.items():
+            subject_texts = [subject] + sorted(keywords)
+            topics = Counter()
+            for keyword_index in keyword_indexes.get(subject, []):
+                topics.update(keyword_index.topics())
+            subject_texts += [topic for topic, _ in topics.most_common(MAX_TOPICS_PER_SUBJECT)]
+            texts[subject] = list(dict.fromkeys(subject_texts))
+        return texts
+
+    @classmethod
+    def build(cls, embed_many, subject_keywords: dict, keyword_indexes=None, **kwargs):
+        """Embed the example texts with embed_many(texts) -> vectors (batched by embed_many).
+
+        keyword_indexes maps each subject to a list of its keyword indexes.
+        """
+        texts = cls.example_texts(subject_keywords, keyword_indexes)
+        flat = [text for subject_texts in texts.values() for text in subject_texts]
+        vectors = embed_many(flat)
+        examples = {}
+        start = 0
+        for subject, subject_texts in texts.items():
+            examples[subject] = vectors[start:start + len(subject_texts)]
+            start += len(subject_texts)
+        return cls(examples, **kwargs)
+
+    def route(self, vector) -> dict:
+        """Return {"subject", "confidence", "scores", "subjects"}; subjects lists every subject
+        worth searching (all of them when confidence is below min_confidence)"""
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = {}
+        for subject, matrix in self._examples.items():
+            similarities = matrix @ query
+            k = min(self.neighbours, similarities.shape[0])
+            scores[subject] = float(np.mean(np.partition(similarities, -k)[-k:])) if k else -1.0
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        confidence = scores[ranked[0]] - scores[ranked[1]] if len(ranked) > 1 else 1.0
+        return {
+            "subject": ranked[0],
+            "confidence": confidence,
+            "scores": scores,
+            "subjects": ranked if confidence < self.min_confidence else ranked[:1],
+        }
@@ -0,0 +1,101 @@
+import threading
+import time
+import pytest
+from google.api_core import exceptions as google_exceptions
+from gemini_client import GeminiScheduler, RateLimitExceeded, TokenBucket
+from tracing import QueryTrace, current_trace
+
+
+def flaky(failures, error=google_exceptions.ServiceUnavailable):
+    """Function failing `failures` times with error before returning "ok"; calls are counted"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error("busy")
+        return "ok"
+    return fn, calls
+
+
+def scheduler(**kwargs):
+    return GeminiScheduler(**{"rpm": 0, "embed_rpm": 0, "max_retries": 2, "base_delay": 0, **kwargs})
+
+
+def test_retryable_errors_are_retried():
+    fn, calls = flaky(2)
+    assert scheduler().call("models/gemini", fn) == "ok"
+    assert len(calls) == 3
+
+
+def test_last_retryable_error_is_raised_and_slots_are_released():
+    gemini = scheduler(max_concurrency=1, max_wait=0.1)
+    fn, calls = flaky(3)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        gemini.call("models/gemini", fn)
+    assert len(calls) == 3
+    assert gemini.call("models/gemini", fn) == "ok"
+
+
+def test_other_errors_are_not_retried():
+    fn, calls = flaky(1, ValueError)
+    with pytest.raises(ValueError):
+        scheduler().call("models/gemini", fn)
+    assert len(calls) == 1
+
+
+def test_identical_calls_in_flight_are_coalesced():
+    gemini = scheduler()
+    release = threading.Event()
+    calls = []
+    results = []
+    follower_trace = QueryTrace()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    def leader():
+        results.append(gemini.call("models/gemini", slow, key="prompt"))
+
+    def follower():
+        current_trace.set(follower_trace)
+        results.append(gemini.call("models/gemini", slow, key="prompt"))
+
+    threads = [threading.Thread(target=leader)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=follower))
+    threads[1].start()
+    deadline = time.monotonic() + 5
+    while not follower_trace.counters["llm_coalesced"] and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["answer", "answer"]
+    assert len(calls) == 1
+    # Once the call is done, the same key is sent again
+    assert gemini.call("models/gemini", slow, key="prompt") == "answer"
+    assert len(calls) == 2
+
+
+def test_rate_limited_call_gives_up_after_max_wait():
+    gemini = scheduler(rpm=60, max_wait=0.1)
+    fn, calls = flaky(0)
+    assert gemini.call("models/gemini", fn) == "ok"
+    with pytest.raises(RateLimitExceeded):
+        gemini.call("models/gemini", fn)
+    assert len(calls) == 1
+    # Embedding models have their own bucket
+    assert gemini.bucket("models/text-embedding-004") is None
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(60)
+    assert bucket.reserve() == 0.0
+    assert 0.9 < bucket.reserve() <= 1.0
+    with pytest.raises(RateLimitExceeded):
+        bucket.reserve(max_wait=0.5)
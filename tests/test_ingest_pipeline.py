@@ -0,0 +1,75 @@
+import json
+import pytest
+from benchmark import synthetic_papers
+from embedding_cache import EmbeddingCache
+from fakes import HashEmbedder
+from gemini_client import GeminiScheduler
+from ingest_manifest import IngestManifest
+from ingest_pipeline import IngestPipeline
+from keyword_index import KeywordIndex
+from local_index import LocalIndex
+
+
+@pytest.fixture
+def setup(tmp_path):
+    papers = tmp_path / "papers"
+    papers.mkdir()
+    paper = next(synthetic_papers(10))
+    index_dir = str(tmp_path / "index")
+    manifest = IngestManifest(namespace="test", path=str(tmp_path / "manifest.sqlite3"))
+    embedder = HashEmbedder()
+
+    def write(questions):
+        (papers / "paper.json").write_text(json.dumps({**paper, "questions": questions}), encoding="utf-8")
+
+    def run(embed_fn=embedder, **kwargs):
+        index = LocalIndex.open(index_dir, dimension=embedder.dimension)
+        cache = EmbeddingCache(path=None, embed_fn=embed_fn, scheduler=GeminiScheduler(rpm=0, embed_rpm=0))
+        pipeline = IngestPipeline(index, manifest, batch_size=2, embed_workers=1, parse_workers=0, cache=cache,
+                                  keyword_index=KeywordIndex(), slim=False, **kwargs)
+        return pipeline.run([str(papers)])
+
+    def saved_ids():
+        return set(LocalIndex.open(index_dir)._ids)
+
+    def manifest_ids():
+        return {doc_id for p in manifest.papers() for doc_id in manifest.hashes(p)}
+
+    return paper, write, run, saved_ids, manifest_ids
+
+
+def test_removed_questions_are_saved_before_the_manifest_forgets_them(setup):
+    paper, write, run, saved_ids, manifest_ids = setup
+    write(paper["questions"])
+    assert run()["embedded"] == 10
+    assert len(saved_ids()) == 10 and saved_ids() == manifest_ids()
+
+    write(paper["questions"][:4])
+    stats = run()
+    assert (stats["embedded"], stats["unchanged"], stats["removed"]) == (0, 4, 6)
+    assert len(saved_ids()) == 4 and saved_ids() == manifest_ids()
+
+    stats = run()
+    assert (stats["unchanged"], stats["removed"]) == (4, 0)
+
+
+def test_interrupted_run_only_records_saved_questions(setup):
+    paper, write, run, saved_ids, manifest_ids = setup
+    write(paper["questions"])
+    embedder = HashEmbedder()
+
+    def failing(model, content, task_type=None, **kwargs):
+        if embedder.calls == 2:
+            raise RuntimeError("embedding failed")
+        return embedder(model, content, task_type)
+
+    with pytest.raises(RuntimeError):
+        run(embed_fn=failing, flush_every=1)
+    recorded = len(manifest_ids())
+    assert recorded < 10
+    assert manifest_ids() <= saved_ids()
+
+    # The next run picks up exactly what is missing
+    stats = run(flush_every=1)
+    assert (stats["embedded"], stats["unchanged"]) == (10 - recorded, recorded)
+    assert len(saved_ids()) == 10 and saved_ids() == manifest_ids()
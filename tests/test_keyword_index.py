@@ -0,0 +1,78 @@
+import pytest
+from keyword_index import KeywordIndex, question_text, tokenize
+
+QUESTIONS = [
+    ("p1", {"questionStatement": "What is the half-life of a radioactive isotope?", "year": "2019",
+            "months": ["May", "June"], "topics": ["Radioactivity"]}),
+    ("p2", {"questionStatement": "A magnet attracts an iron nail. Which magnet pole is north?", "year": "2020",
+            "months": ["October", "November"], "options": {"A": "north", "B": "south"}}),
+    ("p3", {"questionStatement": "Which diagram shows the magnetic field of a magnet?", "year": "2019",
+            "months": "November", "options": ["https://drive.google.com/diagram", "field lines"]}),
+]
+
+
+@pytest.fixture
+def index():
+    index = KeywordIndex()
+    index.upsert(QUESTIONS)
+    return index
+
+
+def test_tokenize_keeps_hyphenated_terms():
+    assert tokenize("Half-life of U-235!") == ["half-life", "of", "u-235"]
+
+
+def test_question_text_skips_image_options():
+    text = question_text(QUESTIONS[2][1])
+    assert "field lines" in text and "https" not in text
+
+
+def test_query_terms_drop_search_instructions():
+    assert KeywordIndex.query_terms("Find questions about the magnet magnet") == ["magnet"]
+
+
+def test_search_ranks_by_term_frequency(index):
+    matches = index.search("magnet")
+    assert [match.id for match in matches] == ["p2", "p3"]
+    assert matches[0].score > matches[1].score > 0
+    assert matches[0].metadata["year"] == "2020"
+    assert index.search("magnet", top_k=1)[0].id == "p2"
+    assert index.search("photosynthesis") == []
+
+
+def test_search_indexes_options_and_topics(index):
+    assert [match.id for match in index.search("radioactivity")] == ["p1"]
+    assert [match.id for match in index.search("south")] == ["p2"]
+
+
+def test_filters(index):
+    assert [match.id for match in index.search("magnet", filter={"year": {"$eq": "2019"}})] == ["p3"]
+    assert [match.id for match in index.search("magnet", filter={"months": "October"})] == ["p2"]
+    assert [match.id for match in index.search("magnet", filter={"months": {"$nin": ["October"]}})] == ["p3"]
+    both = {"$and": [{"year": {"$in": ["2019", "2020"]}}, {"months": {"$ne": "November"}}]}
+    assert index.search("magnet", filter=both) == []
+    with pytest.raises(ValueError):
+        index.search("magnet", filter={"year": {"$gt": "2019"}})
+
+
+def test_has_terms(index):
+    assert index.has_terms(["magnet", "half-life"])
+    assert not index.has_terms(["magnet", "photosynthesis"])
+
+
+def test_upsert_replaces_and_delete_removes(index):
+    index.upsert([("p2", {"questionStatement": "Describe a transformer."})])
+    assert [match.id for match in index.search("magnet")] == ["p3"]
+    index.delete(["p3", "missing"])
+    assert index.search("magnet") == []
+    assert len(index) == 2 and "p3" not in index
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "keywords.json")
+    index.save(path)
+    loaded = KeywordIndex.open(path)
+    assert len(loaded) == 3
+    assert [(m.id, pytest.approx(m.score)) for m in loaded.search("magnet")] == \
+        [(m.id, m.score) for m in index.search("magnet")]
+    assert loaded.topics()["Radioactivity"] == 1
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from local_index import LocalIndex
+
+
+def vector(*values, dimension=4):
+    padded = list(values) + [0.0] * (dimension - len(values))
+    return np.asarray(padded, dtype=np.float32)
+
+
+@pytest.fixture
+def index():
+    index = LocalIndex(dimension=4)
+    index.upsert([
+        ("a", vector(1, 0), {"year": "2019", "variant": "11", "months": ["May", "June"]}),
+        ("b", vector(0, 1), {"year": "2020", "variant": "12", "months": ["October", "November"]}),
+        ("c", vector(1, 1), {"year": "2019", "variant": "12", "months": "November", "topic": "forces"}),
+    ])
+    return index
+
+
+def ids(response):
+    return [match.id for match in response["matches"]]
+
+
+def test_query_ranks_by_cosine(index):
+    response = index.query(vector(1, 0.1), top_k=3, include_metadata=True)
+    assert ids(response) == ["a", "c", "b"]
+    assert response["matches"][0].score == pytest.approx(1 / np.linalg.norm([1, 0.1]))
+    assert response["matches"][0].metadata["year"] == "2019"
+    assert index.query(vector(1, 0), top_k=1)["matches"][0].metadata == {}
+
+
+def test_eq_filter(index):
+    assert sorted(ids(index.query(vector(1, 1), filter={"year": {"$eq": "2019"}}))) == ["a", "c"]
+    assert ids(index.query(vector(1, 1), filter={"year": "2020"})) == ["b"]
+
+
+def test_list_fields_match_any_element(index):
+    assert sorted(ids(index.query(vector(1, 1), filter={"months": {"$eq": "November"}}))) == ["b", "c"]
+    assert sorted(ids(index.query(vector(1, 1), filter={"months": {"$in": ["June", "October"]}}))) == ["a", "b"]
+
+
+def test_negated_and_combined_filters(index):
+    assert ids(index.query(vector(1, 1), filter={"year": {"$ne": "2019"}})) == ["b"]
+    assert ids(index.query(vector(1, 1), filter={"months": {"$nin": ["November"]}})) == ["a"]
+    both = {"$and": [{"year": {"$eq": "2019"}}, {"variant": {"$eq": "12"}}]}
+    assert ids(index.query(vector(1, 1), filter=both)) == ["c"]
+    # Fields without postings are filtered row by row
+    assert ids(index.query(vector(1, 1), filter={"topic": {"$eq": "forces"}})) == ["c"]
+
+
+def test_unsupported_operator(index):
+    with pytest.raises(ValueError):
+        index.query(vector(1, 1), filter={"year": {"$gt": "2019"}})
+
+
+def test_upsert_overwrites_and_reposts(index):
+    index.upsert([("a", vector(0, 0, 1), {"year": "2021"})])
+    assert index.describe_index_stats()["total_vector_count"] == 3
+    assert ids(index.query(vector(0, 0, 1), top_k=1)) == ["a"]
+    assert ids(index.query(vector(1, 1), filter={"year": "2019"})) == ["c"]
+    assert ids(index.query(vector(1, 1), filter={"year": "2021"})) == ["a"]
+
+
+def test_wrong_dimension_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.upsert([("d", [1.0, 0.0], {})])
+
+
+def test_delete_moves_last_row_into_the_gap(index):
+    index.delete(ids=["a", "missing"])
+    assert index.describe_index_stats()["total_vector_count"] == 2
+    assert set(index.fetch(ids=["a", "b", "c"]).vectors) == {"b", "c"}
+    # "c" now lives in the freed row; its vector, metadata and postings moved with it
+    assert ids(index.query(vector(1, 1), top_k=1)) == ["c"]
+    assert ids(index.query(vector(1, 1), filter={"year": "2019"})) == ["c"]
+    assert ids(index.query(vector(1, 1), filter={"variant": "11"})) == []
+    assert index.fetch(ids=["c"]).vectors["c"].metadata["topic"] == "forces"
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.delete(ids=["b"])
+    index.save(str(tmp_path))
+    loaded = LocalIndex.load(str(tmp_path))
+    assert loaded.describe_index_stats() == {"dimension": 4, "total_vector_count": 2}
+    query = vector(1, 0.2)
+    assert ids(loaded.query(query, top_k=2)) == ids(index.query(query, top_k=2))
+    assert ids(loaded.query(query, filter={"months": {"$eq": "June"}})) == ["a"]
+    np.testing.assert_allclose(loaded.fetch(ids=["c"]).vectors["c"].values, vector(1, 1) / np.sqrt(2), rtol=1e-6)
+
+    # The loaded matrix is memory-mapped read-only; writes copy it first
+    loaded.upsert([("d", vector(0, 1), {"year": "2022"})])
+    loaded.delete(ids=["a"])
+    loaded.flush()
+    reloaded = LocalIndex.open(str(tmp_path))
+    assert set(reloaded.fetch(ids=["a", "c", "d"]).vectors) == {"c", "d"}
+
+
+def test_open_missing_path_starts_empty(tmp_path):
+    index = LocalIndex.open(str(tmp_path / "new"), dimension=4)
+    assert index.describe_index_stats()["total_vector_count"] == 0
+    assert index.query(vector(1), top_k=5)["matches"] == []
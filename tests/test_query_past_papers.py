@@ -0,0 +1,49 @@
+import io
+import json
+from collections import Counter
+from types import SimpleNamespace
+from query_past_papers import read_queries, run_batch
+
+
+class StubProcessor:
+    """Answers every query with one match; "busy" fails the first time it is searched"""
+
+    def __init__(self):
+        self.searches = Counter()
+
+    def search_questions(self, query, top_k, relevance_threshold, max_results):
+        self.searches[query.strip().lower()] += 1
+        if query == "busy" and self.searches["busy"] == 1:
+            raise RuntimeError("503 busy")
+        return [SimpleNamespace(id=query.strip().lower(), score=1.0, metadata={"query": query})]
+
+
+def batch(queries, **kwargs):
+    processor, out = StubProcessor(), io.StringIO()
+    stats = run_batch(processor, queries, out, **kwargs)
+    return processor, stats, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_repeated_queries_are_searched_once_and_written_in_order():
+    queries = ["magnetism", "Magnetism ", "acids", "magnetism"]
+    processor, stats, records = batch(queries)
+    assert processor.searches == {"magnetism": 1, "acids": 1}
+    assert [record["query"] for record in records] == queries
+    assert [record["duplicate"] for record in records] == [False, True, False, True]
+    assert stats["queries"] == 4 and stats["unique"] == 2
+
+
+def test_failed_searches_are_not_reused():
+    # One worker searches in submission order, so "busy" has failed before it comes back
+    processor, stats, records = batch(["busy", "acids", "waves", "busy"], workers=1)
+    assert processor.searches["busy"] == 2
+    assert "error" in records[0] and "error" not in records[3]
+    assert records[3]["results"][0]["id"] == "busy"
+    assert stats["errors"] == 1
+
+
+def test_read_queries_skips_blanks_comments_and_bad_json():
+    errors = []
+    stream = io.StringIO('magnetism\n\n# comment\n{"query": " acids "}\n{"q": 1}\n')
+    assert list(read_queries(stream, errors)) == ["magnetism", "acids"]
+    assert [number for number, _ in errors] == [5]
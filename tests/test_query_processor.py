@@ -0,0 +1,34 @@
+import asyncio
+import pytest
+from local_index import Match
+from query_processor import RRF_K, QueryProcessor
+from search_service import fake_services
+
+
+def test_reference_with_unconfigured_subject_code_is_not_embedded():
+    query_processor, _ = fake_services(50)
+    query_processor.semantic_cache = None
+    query_processor.subject_codes = {code: subject for code, subject in query_processor.subject_codes.items()
+                                     if code != "5054"}
+    embedder = query_processor.embedding_cache.embed_fn
+    calls = embedder.calls
+    results = asyncio.run(query_processor.asearch_questions("5054 variant 11 question 3 2000", hydrate=False))
+    assert [match.id for match in results] == ["5054_11_February/March 2000_q3"]
+    assert embedder.calls == calls
+
+
+def test_fuse_ranks_matches_found_by_several_lists_first():
+    dense = [Match(id="a", score=0.9, metadata={"from": "dense"}), Match(id="b", score=0.8, metadata={})]
+    keyword = [Match(id="b", score=12.0, metadata={}), Match(id="c", score=9.0, metadata={})]
+    fused = QueryProcessor._fuse([dense, keyword], limit=10)
+    assert [match.id for match in fused] == ["b", "a", "c"]
+    assert fused[0].score == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert fused[1].score == pytest.approx(1 / (RRF_K + 1))
+    # The first list a match appears in gives its metadata
+    assert fused[1].metadata == {"from": "dense"}
+
+
+def test_fuse_keeps_the_best_limit_matches():
+    ranked = [Match(id=str(i), score=1.0, metadata={}) for i in range(5)]
+    assert [match.id for match in QueryProcessor._fuse([ranked], limit=2)] == ["0", "1"]
+    assert QueryProcessor._fuse([], limit=2) == []
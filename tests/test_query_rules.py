@@ -0,0 +1,91 @@
+from query_rules import PAPER_VARIANTS, paper_variants, parse_query_rules, reference_ids
+
+
+def test_full_reference():
+    parsed = parse_query_rules("5054 question 5 2019")
+    assert parsed["filters"] == {"subjectCode": "5054", "questionNumber": "5", "year": "2019"}
+    assert parsed["subject"] == "physics"
+    assert parsed["search_text"] == "5054 question 5 2019"
+
+
+def test_glued_forms():
+    assert parse_query_rules("q7 v12 5070")["filters"] == {"questionNumber": "7", "variant": "12", "subjectCode": "5070"}
+    assert parse_query_rules("5054/12 q3")["filters"] == {"subjectCode": "5054", "variant": "12", "questionNumber": "3"}
+
+
+def test_two_digit_years_are_expanded():
+    assert parse_query_rules("magnetism nov 19")["filters"] == {"months": "November", "year": "2019"}
+    assert parse_query_rules("acids '21")["filters"] == {"year": "2021"}
+
+
+def test_month_short_forms():
+    assert parse_query_rules("oct 2020 circuits")["filters"] == {"months": "October", "year": "2020"}
+    assert parse_query_rules("sept 2018")["filters"]["months"] == "September"
+
+
+def test_first_of_several_months():
+    assert parse_query_rules("may/june 2019")["filters"] == {"months": "May", "year": "2019"}
+
+
+def test_may_is_only_a_month_next_to_a_year():
+    assert parse_query_rules("forces that may act on a car")["filters"] == {}
+    assert parse_query_rules("may 2019 forces")["filters"] == {"months": "May", "year": "2019"}
+    assert parse_query_rules("2019 may forces")["filters"] == {"year": "2019", "months": "May"}
+
+
+def test_conflicting_values_are_left_to_gemini():
+    assert parse_query_rules("2019 2020 questions") is None
+    assert parse_query_rules("question 3 question 4") is None
+
+
+def test_unplaced_numbers_and_ambiguous_words_are_left_to_gemini():
+    assert parse_query_rules("top 5 magnetism questions") is None
+    assert parse_query_rules("recent magnetism questions") is None
+    assert parse_query_rules("paper 2 magnetism")["filters"] == {}
+
+
+def test_subject_from_keywords():
+    assert parse_query_rules("half-life questions")["subject"] == "physics"
+    assert parse_query_rules("titration")["subject"] == "chemistry"
+    # Keywords of both subjects: no guess
+    assert parse_query_rules("metal resistance")["subject"] is None
+
+
+def test_current_is_a_physics_keyword_unless_it_is_a_date():
+    assert parse_query_rules("electric current questions")["subject"] == "physics"
+    assert parse_query_rules("current year magnetism questions") is None
+    assert parse_query_rules("current paper magnetism") is None
+
+
+def test_configured_subject_codes_are_not_years():
+    parsed = parse_query_rules("2058 question 4 2019", {"2058": "islamiyat"}, {})
+    assert parsed["filters"] == {"subjectCode": "2058", "questionNumber": "4", "year": "2019"}
+    assert parsed["subject"] == "islamiyat"
+
+
+def test_reference_ids_expand_variants_and_sessions():
+    ids = reference_ids({"subjectCode": "5054", "year": "2019", "questionNumber": "05"})
+    assert len(ids) == len(PAPER_VARIANTS) * 3
+    assert "5054_12_May/June 2019_q5" in ids
+
+
+def test_reference_ids_accept_formatted_filters():
+    filters = {"subjectCode": {"$eq": "5054"}, "year": {"$eq": "2019"}, "questionNumber": {"$eq": "5"},
+               "variant": {"$eq": "12"}, "months": {"$eq": "November"}}
+    assert reference_ids(filters) == ["5054_12_October/November 2019_q5"]
+
+
+def test_reference_ids_need_code_year_and_question():
+    assert reference_ids({"subjectCode": "5054", "year": "2019"}) is None
+    assert reference_ids({"subjectCode": "5054", "year": "2019", "questionNumber": "five"}) is None
+
+
+def test_reference_ids_per_paper_variants():
+    filters = {"subjectCode": "5054", "year": "2019", "questionNumber": "5"}
+    assert {doc_id.split("_")[1] for doc_id in reference_ids(filters, ["21", "22"])} == {"21", "22"}
+    assert reference_ids({**filters, "variant": "12"}, ["21", "22"]) == []
+
+
+def test_paper_variants():
+    assert paper_variants("Paper 2") == ["21", "22", "23"]
+    assert paper_variants(None) == PAPER_VARIANTS
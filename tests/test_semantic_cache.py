@@ -0,0 +1,59 @@
+import numpy as np
+from semantic_cache import SemanticQueryCache
+
+
+def unit(*values, dimension=8):
+    vector = np.zeros(dimension, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+def test_near_duplicate_in_scope_hits():
+    cache = SemanticQueryCache(max_entries=4, max_distance=0.05, dimension=8)
+    scope = SemanticQueryCache.scope("physics", {"year": {"$eq": "2019"}}, 10)
+    cache.set(unit(1, 0.1), scope, ["a"])
+    assert cache.get(unit(1, 0.12), scope) == ["a"]
+    assert cache.get(unit(1, 1), scope) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_other_scope_misses():
+    cache = SemanticQueryCache(max_entries=4, dimension=8)
+    cache.set(unit(1), SemanticQueryCache.scope("physics", {}, 10), ["a"])
+    assert cache.get(unit(1), SemanticQueryCache.scope("chemistry", {}, 10)) is None
+    assert cache.get(unit(1), SemanticQueryCache.scope("physics", {}, 20)) is None
+
+
+def test_closest_entry_wins():
+    cache = SemanticQueryCache(max_entries=4, max_distance=0.5, dimension=8)
+    cache.set(unit(1, 0.5), "s", ["far"])
+    cache.set(unit(1, 0.05), "s", ["near"])
+    assert cache.get(unit(1), "s") == ["near"]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticQueryCache(max_entries=2, max_distance=0.01, dimension=8)
+    cache.set(unit(1), "s", ["x"])
+    cache.set(unit(0, 1), "s", ["y"])
+    assert cache.get(unit(1), "s") == ["x"]
+    cache.set(unit(0, 0, 1), "s", ["z"])
+    assert cache.get(unit(0, 1), "s") is None
+    assert cache.get(unit(1), "s") == ["x"]
+    assert cache.get(unit(0, 0, 1), "s") == ["z"]
+
+
+def test_expired_entries_miss():
+    cache = SemanticQueryCache(max_entries=2, ttl=0, dimension=8)
+    cache.set(unit(1), "s", ["x"])
+    assert cache.get(unit(1), "s") is None
+
+
+def test_many_scopes_and_clear():
+    cache = SemanticQueryCache(max_entries=2, dimension=8)
+    for i in range(20):
+        cache.set(unit(1), f"scope {i}", [i])
+    assert cache.get(unit(1), "scope 19") == [19]
+    assert cache.get(unit(1), "scope 0") is None
+    cache.clear()
+    assert cache.get(unit(1), "scope 19") is None
+    assert cache.stats()["entries"] == 0
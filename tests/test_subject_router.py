@@ -0,0 +1,69 @@
+import pytest
+from embedding_cache import EmbeddingCache
+from fakes import HashEmbedder
+from gemini_client import GeminiScheduler
+from keyword_index import KeywordIndex
+from search_service import fake_services
+from subject_router import SubjectRouter
+
+
+def test_route_picks_the_nearest_subject():
+    router = SubjectRouter({"physics": [[1, 0], [0.9, 0.1]], "chemistry": [[0, 1], [0.1, 0.9]]},
+                           min_confidence=0.1, neighbours=2)
+    routed = router.route([1, 0.05])
+    assert routed["subject"] == "physics"
+    assert routed["subjects"] == ["physics"]
+    assert routed["confidence"] > 0.1
+
+
+def test_unsure_route_lists_every_subject():
+    router = SubjectRouter({"physics": [[1, 0]], "chemistry": [[0, 1]]}, min_confidence=0.1)
+    routed = router.route([1, 1])
+    assert routed["confidence"] == pytest.approx(0)
+    assert sorted(routed["subjects"]) == ["chemistry", "physics"]
+
+
+def test_example_texts_include_indexed_topics():
+    keyword_index = KeywordIndex()
+    keyword_index.upsert([("q1", {"questionStatement": "x", "topics": ["magnetism"]}),
+                          ("q2", {"questionStatement": "y", "topics": ["magnetism", "waves"]})])
+    texts = SubjectRouter.example_texts({"physics": {"force"}}, {"physics": [keyword_index]})
+    assert texts == {"physics": ["physics", "force", "magnetism", "waves"]}
+
+
+def test_build_embeds_more_than_one_api_call_allows():
+    embedder = HashEmbedder(dimension=32)
+
+    def limited(model, content, task_type=None, **kwargs):
+        assert len(content) <= 100
+        return embedder(model, content, task_type)
+
+    cache = EmbeddingCache(path=None, embed_fn=limited, scheduler=GeminiScheduler(rpm=0, embed_rpm=0))
+    keywords = {"physics": {f"physics term {i}" for i in range(150)}, "chemistry": {"acid", "salt"}}
+    router = SubjectRouter.build(lambda texts: cache.embed_many(texts, "models/embedding", "retrieval_query"),
+                                 keywords)
+    assert embedder.calls == 2
+    assert router.route(embedder.vector("physics term 7"))["subject"] == "physics"
+
+
+def test_failed_build_is_not_retried_on_every_query():
+    query_processor, _ = fake_services(50)
+    query_processor.semantic_cache = None
+    embedder = query_processor.embedding_cache.embed_fn
+    builds = []
+
+    def failing_batches(model, content, task_type=None, **kwargs):
+        if isinstance(content, list) and len(content) > 1:
+            builds.append(len(content))
+            raise RuntimeError("batch too large")
+        return embedder(model, content, task_type)
+
+    query_processor.embedding_cache.embed_fn = failing_batches
+    for query in ["describe what happens during the experiment", "explain the result of the experiment"]:
+        parsed = query_processor.analyze_query(query)
+        assert sorted(parsed["subjects"]) == ["chemistry", "physics"]
+    assert len(builds) == 1
+
+    query_processor._router_failure = (0.0, RuntimeError("long ago"))
+    query_processor.embedding_cache.embed_fn = embedder
+    assert query_processor.analyze_query("describe what happens during the experiment")["path"] == "rules+router"
@@ -0,0 +1,34 @@
+import asyncio
+from search_service import fake_services
+from tracing import QueryTrace, count, current_trace, span
+
+
+def test_span_and_count_record_into_the_current_trace():
+    trace = QueryTrace()
+    token = current_trace.set(trace)
+    try:
+        with span("embed"):
+            count("embed_calls")
+        with span("embed"):
+            count("embed_calls", 2)
+    finally:
+        current_trace.reset(token)
+    count("embed_calls")
+    assert [stage for stage, _ in trace.spans] == ["embed", "embed"]
+    assert trace.counters["embed_calls"] == 3
+    assert set(trace.to_dict()["stages"]) == {"embed"}
+
+
+def test_each_search_in_a_task_gets_its_own_trace():
+    query_processor, _ = fake_services(50)
+    first, last = QueryTrace(), QueryTrace()
+
+    async def searches():
+        await query_processor.asearch_questions("physics magnetism question", trace=first)
+        await query_processor.asearch_questions("chemistry acid question")
+        await query_processor.asearch_questions("physics waves question", trace=last)
+        return current_trace.get()
+
+    assert asyncio.run(searches()) is None
+    assert first.counters["searches"] == 1
+    assert last.counters["searches"] == 1
@@ -0,0 +1,66 @@
+import time
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from metrics import registry
+
+# Trace of the query currently being processed; None (the default) disables recording
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class QueryTrace:
+    """Wall time per pipeline stage and call counters for one query"""
+
+    def __init__(self):
+        self.spans = []  # (stage, seconds) in completion order
+        self.counters = Counter()
+
+    def record(self, stage: str, seconds: float):
+        self.spans.append((stage, seconds))
+
+    def stage_totals(self) -> dict:
+        """Seconds spent per stage, summed over repeated spans (e.g. several index queries)"""
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def to_dict(self) -> dict:
+        return {"stages": self.stage_totals(), "counters": dict(self.counters)}
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block into the current trace, if there is one, and the metrics registry, if enabled"""
+    trace = current_trace.get()
+    if trace is None and not registry.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if trace is not None:
+            trace.record(stage, seconds)
+        registry.observe(stage, seconds)
+
+
+def count(name: str, amount=1, **labels):
+    """Add to a counter of the current trace, if there is one, and the metrics registry.
+
+    labels only split the exported metric (e.g. count("fallbacks", stage="parse")).
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.counters[name] += amount
+    registry.inc(name, amount, **labels)
+
+
+def count_llm_usage(response):
+    """Count the prompt and output tokens Gemini reports for a (fully consumed) response"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    count("llm_prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0)
+    count("llm_output_tokens", getattr(usage, "candidates_token_count", 0) or 0)